@@ -1,6 +1,53 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db.models.signals import pre_delete
+
+
+WRITE_BEHIND_STORAGE = 'cart.storage.CacheCartStorage'
+# Backends that drop entries on their own (culling at MAX_ENTRIES, LRU eviction) or don't keep them at all
+EVICTING_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_cart_cache(app_configs, **kwargs):
+    """
+    The write-behind cart store keeps unsaved carts in the cache only, so a cache that evicts entries loses
+    cart changes without any error.
+    """
+    if settings.CART_STORAGE_BACKEND != WRITE_BEHIND_STORAGE:
+        return []
+    errors = []
+    backend = settings.CACHES.get(settings.CART_CACHE_ALIAS, {}).get('BACKEND')
+    if backend is None or backend in EVICTING_CACHE_BACKENDS:
+        errors.append(checks.Error(
+            f"CART_STORAGE_BACKEND is {WRITE_BEHIND_STORAGE} but the '{settings.CART_CACHE_ALIAS}' cache "
+            f"({backend}) can evict entries, unflushed cart changes would be lost.",
+            hint="Point CART_CACHE_ALIAS at a Redis cache configured with maxmemory-policy noeviction, or silence "
+                 "cart.E001 for a custom backend that never evicts.",
+            id='cart.E001',
+        ))
+    if settings.CART_CACHE_TIMEOUT <= settings.CART_IDLE_FLUSH_AFTER:
+        errors.append(checks.Error(
+            "CART_CACHE_TIMEOUT must be greater than CART_IDLE_FLUSH_AFTER, or idle carts expire from the cache "
+            "before flush_carts writes them.",
+            id='cart.E002',
+        ))
+    return errors
 
 
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        from cart.storage import discard_deleted_product
+
+        checks.register(check_cart_cache)
+        pre_delete.connect(discard_deleted_product, sender='product.Product')
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def cart_summary_key(user_id):
+    return f"cart:summary:{user_id}"
+
+
+def get_cart_summary(cart):
+    """
+    Returns the summary (item count, subtotal and version) of a cart.
+    """
+    return {"count": cart.item_count, "subtotal": cart.subtotal, "version": cart.version}
+
+
+def get_cached_cart_summary(user_id):
+    return cache.get(cart_summary_key(user_id))
+
+
+def set_cached_cart_summary(user_id, summary):
+    cache.set(cart_summary_key(user_id), summary, settings.CART_SUMMARY_CACHE_TIMEOUT)
+
+
+def invalidate_cart_summary(user_id):
+    """
+    Drops the cached summary of a user's cart once the current transaction commits (immediately outside one),
+    so a concurrent read can't cache the cart as it was before the change.
+    """
+    transaction.on_commit(lambda: cache.delete(cart_summary_key(user_id)))
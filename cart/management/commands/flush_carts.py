@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from cart.storage import flush_idle_carts
+
+
+class Command(BaseCommand):
+    help = "Writes idle carts kept by the cache cart storage to the database (run it periodically)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--idle-after', type=int, default=None,
+            help="Only flush carts unchanged for this many seconds (defaults to CART_IDLE_FLUSH_AFTER, 0 flushes all)",
+        )
+
+    def handle(self, *args, **options):
+        flushed = flush_idle_carts(options['idle_after'])
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} carts"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from cart.totals import repair_cart_totals
+
+
+class Command(BaseCommand):
+    help = "Checks every cart's item_count and subtotal against its items and repairs the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the drifted carts")
+
+    def handle(self, *args, **options):
+        drift = repair_cart_totals(dry_run=options['dry_run'])
+        for cart_id, (item_count, subtotal), (expected_count, expected_subtotal) in drift:
+            self.stdout.write(
+                f"Cart {cart_id}: {item_count} items / {subtotal} stored, {expected_count} items / {expected_subtotal} expected"
+            )
+        action = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(drift)} carts with drifted totals"))
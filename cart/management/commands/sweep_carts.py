@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from cart.sweeper import sweep_carts
+
+
+class Command(BaseCommand):
+    help = "Deletes or archives carts left idle for longer than CART_SWEEP_IDLE_DAYS, in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-days', type=int, default=None, help="Defaults to CART_SWEEP_IDLE_DAYS")
+        parser.add_argument('--batch-size', type=int, default=None, help="Defaults to CART_SWEEP_BATCH_SIZE")
+        parser.add_argument('--archive', action='store_true', help="Keep a snapshot of each cart in ArchivedCart")
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        report = sweep_carts(
+            idle_days=options['idle_days'],
+            batch_size=options['batch_size'],
+            archive=options['archive'],
+            max_batches=options['max_batches'],
+            pause=options['pause'],
+        )
+        action = "Archived" if options['archive'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {report['carts']} carts ({report['items']} items) in {report['batches']} batches, "
+            f"{report['seconds']:.1f}s, {report['carts_per_second']:.0f} carts/s"
+        ))
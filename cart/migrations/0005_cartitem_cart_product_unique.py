@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Rows duplicated by the old get_or_create race are folded into the oldest one
+    CartItem = apps.get_model('cart', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart', 'product')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        items = CartItem.objects.filter(cart=duplicate['cart'], product=duplicate['product'])
+        items.filter(id=duplicate['keep']).update(quantity=duplicate['total'])
+        items.exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_alter_cartitem_price_alter_cartitem_quantity'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cart_item_cart_product_unique'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:23
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from cart.totals import with_expected_totals
+
+
+def backfill_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    Product = apps.get_model('product', 'Product')
+    # The price snapshot was never written, take the current product price
+    CartItem.objects.filter(price=0).update(
+        price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+    carts = with_expected_totals(Cart, CartItem).only('id')
+    Cart.objects.bulk_update(
+        [Cart(id=cart.id, item_count=cart.expected_item_count, subtotal=cart.expected_subtotal) for cart in carts],
+        ['item_count', 'subtotal'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cartitem_cart_product_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:27
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0007_cart_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('items', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at', 'id'], name='cart_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedcart',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_carts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0008_archivedcart_cart_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='dirty_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('dirty_since__isnull', False)), fields=['dirty_since'], name='cart_dirty_idx'),
+        ),
+    ]
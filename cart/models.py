@@ -1,23 +1,217 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Prefetch
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from cart.cache import invalidate_cart_summary
+from product.models import Product
+
+
+def fold_operations(quantities, operations):
+    """
+    Applies {op, product_id, quantity} operations ('add', 'remove' or 'set') to a {product_id: quantity}
+    dict in place and returns it. Removed products are kept with a quantity of 0.
+    """
+    for operation in operations:
+        product_id, quantity = operation['product_id'], operation.get('quantity')
+        current = quantities.get(product_id, 0)
+        if operation['op'] == 'add':
+            quantities[product_id] = current + quantity
+        elif operation['op'] == 'set':
+            quantities[product_id] = quantity
+        else:
+            quantities[product_id] = current - quantity if quantity and quantity < current else 0
+    return quantities
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Loads the cart with its items and their products in a fixed number of queries regardless of how
+        many items the cart holds.
+        """
+        return self.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('id'))
+        )
+
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by every cart mutation, so reading the totals never touches the items
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Incremented by every change to the cart contents
+    version = models.PositiveIntegerField(default=0)
+    # Set while the cache cart storage holds changes that are not written to the items yet, see
+    # cart.storage.CacheCartStorage
+    dirty_since = models.DateTimeField(null=True, blank=True)
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Drives the abandoned cart sweeper
+            models.Index(fields=['updated_at', 'id'], name='cart_updated_idx'),
+            # The carts flush_carts has to write
+            models.Index(fields=['dirty_since'], name='cart_dirty_idx', condition=models.Q(dirty_since__isnull=False)),
+        ]
 
     def __str__(self):
         return f"Cart {self.id} for {self.user.username}"
 
+    def adjust_totals(self, item_count, subtotal):
+        """
+        Moves item_count and subtotal by the given deltas (and the version by one) with a single atomic UPDATE.
+        """
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F('item_count') + item_count,
+            subtotal=F('subtotal') + subtotal,
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        invalidate_cart_summary(self.user_id)
+
+    def add_product(self, product, quantity):
+        """
+        Adds `quantity` units of a product, creating the cart item (with the current product price as its
+        unit price) if needed.
+
+        The increment is a single `quantity = quantity + n` UPDATE, and the (cart, product) unique
+        constraint turns a concurrent insert of the same item into an increment, so simultaneous
+        requests neither lose updates nor create duplicate rows.
+        """
+        items = CartItem.objects.filter(cart=self, product=product)
+        with transaction.atomic():
+            if not items.update(quantity=F('quantity') + quantity):
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(cart=self, product=product, quantity=quantity, price=product.price)
+                except IntegrityError:
+                    # Another request created the item in the meantime
+                    items.update(quantity=F('quantity') + quantity)
+            item = items.select_related('product').get()
+            self.adjust_totals(quantity, quantity * item.price)
+        return item
+
+    def remove_product(self, product_id, quantity=None):
+        """
+        Removes `quantity` units of a product, or the whole item if `quantity` is empty or not smaller
+        than what is in the cart. Returns False if the product is not in the cart.
+        """
+        items = CartItem.objects.filter(cart=self, product_id=product_id)
+        while True:
+            item = items.only('quantity', 'price').first()
+            if not item:
+                return False
+            # Each write only applies if the quantity is still the one read above, otherwise start over
+            current = items.filter(quantity=item.quantity)
+            with transaction.atomic():
+                if quantity and quantity < item.quantity:
+                    removed = quantity
+                    written = current.update(quantity=F('quantity') - quantity)
+                else:
+                    removed = item.quantity
+                    written, _ = current.delete()
+                if written:
+                    self.adjust_totals(-removed, -removed * item.price)
+                    return True
+
+    def apply_operations(self, operations, attempts=3):
+        """
+        Applies a list of {op, product_id, quantity} operations ('add', 'remove' or 'set') in one transaction.
+
+        The affected items are locked and read once, the operations are folded into final quantities in
+        memory, and the result is written with one bulk insert, one bulk update and one delete.
+        """
+        product_ids = {operation['product_id'] for operation in operations}
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    items = {
+                        item.product_id: item
+                        for item in CartItem.objects.select_for_update().filter(cart=self, product_id__in=product_ids)
+                    }
+                    quantities = fold_operations(
+                        {product_id: item.quantity for product_id, item in items.items()}, operations
+                    )
+
+                    new_ids = [product_id for product_id, quantity in quantities.items() if quantity and product_id not in items]
+                    prices = dict(Product.objects.filter(id__in=new_ids).values_list('id', 'price'))
+
+                    new_items, changed_items, removed_ids = [], [], []
+                    count_delta = subtotal_delta = 0
+                    for product_id, quantity in quantities.items():
+                        item = items.get(product_id)
+                        if item is None:
+                            if quantity:
+                                item = CartItem(cart=self, product_id=product_id, quantity=0, price=prices[product_id])
+                                new_items.append(item)
+                        elif not quantity:
+                            removed_ids.append(item.id)
+                        elif quantity != item.quantity:
+                            changed_items.append(item)
+                        if item is not None:
+                            count_delta += quantity - item.quantity
+                            subtotal_delta += (quantity - item.quantity) * item.price
+                            item.quantity = quantity
+
+                    CartItem.objects.bulk_create(new_items)
+                    CartItem.objects.bulk_update(changed_items, ['quantity'])
+                    CartItem.objects.filter(id__in=removed_ids).delete()
+                    if count_delta or subtotal_delta:
+                        self.adjust_totals(count_delta, subtotal_delta)
+                return
+            except IntegrityError:
+                # A concurrent request inserted one of the new items, start over from the fresh state
+                if attempt == attempts - 1:
+                    raise
+
+    def clear(self):
+        """
+        Deletes every item and resets the totals.
+        """
+        with transaction.atomic():
+            CartItem.objects.filter(cart=self).delete()
+            Cart.objects.filter(pk=self.pk).update(
+                item_count=0, subtotal=0, version=F('version') + 1, updated_at=timezone.now()
+            )
+            invalidate_cart_summary(self.user_id)
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey('product.Product', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(blank=False, null=False, default=0)
+    # Unit price of the product when it was first added to the cart
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=False, null=False, default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_item_cart_product_unique'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.title}"
     
     @property
     def total_price(self):
-        return self.product.price * self.quantity
+        return self.price * self.quantity
+
+
+class ArchivedCart(models.Model):
+    """
+    Snapshot of an abandoned cart removed by the cart sweeper (see cart.sweeper).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='archived_carts', on_delete=models.CASCADE)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # [{"product": id, "quantity": n, "price": "unit price"}, ...]
+    items = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived cart {self.id} for user {self.user_id}"
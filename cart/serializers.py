@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from cart.models import Cart, CartItem
 
@@ -18,7 +19,36 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'total_cart_price']
+        fields = ['id', 'user', 'items', 'item_count', 'total_cart_price']
 
     def get_total_cart_price(self, obj):
-        return sum([item.total_price for item in obj.items.all()])
+        # Maintained on the cart by every mutation
+        return obj.subtotal
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'remove', 'set'])
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        quantity = attrs.get('quantity')
+        if attrs['op'] == 'add':
+            if quantity == 0:
+                raise serializers.ValidationError({"quantity": "Quantity must be greater than 0."})
+            attrs['quantity'] = quantity or 1
+        elif attrs['op'] == 'set' and quantity is None:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        # Checked here rather than with max_length so the setting is read per request, not at import time
+        if len(operations) > settings.CART_BATCH_MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {settings.CART_BATCH_MAX_OPERATIONS} elements."
+            )
+        return operations
@@ -0,0 +1,324 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from cart.cache import get_cart_summary, invalidate_cart_summary
+from cart.models import Cart, CartItem, fold_operations
+from product.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_cart_storage(user):
+    """
+    Returns the cart storage (CART_STORAGE_BACKEND) for a user.
+    """
+    return import_string(settings.CART_STORAGE_BACKEND)(user)
+
+
+class DatabaseCartStorage:
+    """
+    Reads and writes the cart straight from the Cart and CartItem tables. This is the default backend.
+    """
+    def __init__(self, user):
+        self.user = user
+
+    def get_cart(self):
+        """
+        Returns the user's cart with its items, or None if they don't have one yet.
+        """
+        return Cart.objects.with_items().filter(user_id=self.user.pk).first()
+
+    def add_product(self, product, quantity):
+        cart, created = Cart.objects.get_or_create(user_id=self.user.pk)
+        return cart.add_product(product, quantity)
+
+    def remove_product(self, product_id, quantity=None):
+        cart = Cart.objects.filter(user_id=self.user.pk).first()
+        return bool(cart) and cart.remove_product(product_id, quantity)
+
+    def apply_operations(self, operations):
+        cart, created = Cart.objects.get_or_create(user_id=self.user.pk)
+        cart.apply_operations(operations)
+        return Cart.objects.with_items().get(pk=cart.pk)
+
+    def get_summary(self):
+        cart = Cart.objects.filter(user_id=self.user.pk).only('item_count', 'subtotal', 'version').first()
+        return get_cart_summary(cart or Cart())
+
+    def flush(self, idle_after=None):
+        return False
+
+    def clear(self):
+        cart = Cart.objects.filter(user_id=self.user.pk).first()
+        if cart:
+            cart.clear()
+
+    @classmethod
+    def discard_product(cls, product_id):
+        """
+        Takes a product that is being deleted out of the totals of every cart holding it (its CartItem rows
+        are deleted along with it). Returns the ids of the users whose cart held it.
+        """
+        items = CartItem.objects.select_for_update().select_related('cart').filter(product_id=product_id).order_by('cart_id')
+        user_ids = []
+        for item in items:
+            item.cart.adjust_totals(-item.quantity, -item.total_price)
+            user_ids.append(item.cart.user_id)
+        return user_ids
+
+
+class CartLockTimeout(Exception):
+    pass
+
+
+@contextmanager
+def cache_lock(cache, key):
+    """
+    Mutual exclusion across processes through an atomic `cache.add`. Waiting gives up after CART_LOCK_TIMEOUT
+    seconds; the lock itself expires after CART_LOCK_TTL seconds, so a crashed holder can't block the cart
+    forever.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.CART_LOCK_TIMEOUT
+    delay = 0.001
+    while not cache.add(key, token, settings.CART_LOCK_TTL):
+        if time.monotonic() > deadline:
+            raise CartLockTimeout(f"Timed out waiting for {key}")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+        else:
+            logger.warning(f"{key} expired while it was held, raise CART_LOCK_TTL")
+
+
+class CacheCartStorage:
+    """
+    Keeps the live cart in the cache as a {product_id: quantity} entry and writes it to the CartItem
+    table behind the requests (write-behind). A dirty cart is flushed:
+
+    * on checkout, `OrderView.create_order` flushes the cart before reading it,
+    * by the first mutation made CART_FLUSH_INTERVAL seconds or more after the cart became dirty,
+    * by `manage.py flush_carts`, once the cart has been idle for CART_IDLE_FLUSH_AFTER seconds.
+
+    Mutations of a cart are serialized with a per-user cache lock, so the cache (CART_CACHE_ALIAS) must
+    be shared by every process serving requests; locmem is only suitable for a single process.
+    """
+    def __init__(self, user):
+        self.user = user
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self.key = f"cart:state:{user.pk}"
+
+    def _locked(self):
+        return cache_lock(self.cache, f"cart:lock:{self.user.pk}")
+
+    def _read_state(self, cart):
+        rows = []
+        if cart:
+            rows = CartItem.objects.filter(cart=cart).order_by('id').values_list('product_id', 'id', 'quantity', 'price')
+        return {
+            'cart_id': cart and cart.id,
+            'quantities': {product_id: quantity for product_id, item_id, quantity, price in rows},
+            'item_ids': {product_id: item_id for product_id, item_id, quantity, price in rows},
+            'prices': {product_id: price for product_id, item_id, quantity, price in rows},
+            'version': cart.version if cart else 0,
+            'dirty_since': None,
+        }
+
+    def _load(self):
+        state = self.cache.get(self.key)
+        if state is None:
+            state = self._read_state(Cart.objects.filter(user_id=self.user.pk).first())
+        return state
+
+    def _save(self, state):
+        state['touched_at'] = time.time()
+        self.cache.set(self.key, state, settings.CART_CACHE_TIMEOUT)
+
+    def _set_dirty(self, dirty):
+        # Marks the cart's own row, so flush_carts finds the dirty carts without scanning the cache. Written
+        # when the cart becomes dirty and when it is flushed, not by every mutation.
+        Cart.objects.filter(user_id=self.user.pk).update(dirty_since=timezone.now() if dirty else None)
+
+    def _mutate(self, operations, required_product_id=None):
+        """
+        Applies cart operations to the cached cart under the lock. With `required_product_id`, nothing is
+        changed (and False is returned) unless that product is in the cart.
+        """
+        with self._locked():
+            state = self._load()
+            if required_product_id is not None and not state['quantities'].get(required_product_id):
+                return False, state
+            if state['cart_id'] is None:
+                state['cart_id'] = Cart.objects.get_or_create(user_id=self.user.pk)[0].id
+            fold_operations(state['quantities'], operations)
+            state['version'] += 1
+            if state['dirty_since'] is None:
+                state['dirty_since'] = time.time()
+                self._set_dirty(True)
+            self._save(state)
+            # Only once the new state is saved, or a summary read in between would cache the old one again
+            invalidate_cart_summary(self.user.pk)
+            if time.time() - state['dirty_since'] >= settings.CART_FLUSH_INTERVAL:
+                self._flush(state)
+        return True, state
+
+    def _flush(self, state):
+        quantities = state['quantities']
+        # Products deleted since they were added are dropped rather than failing the whole flush
+        existing_ids = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+        cart, created = Cart.objects.get_or_create(user_id=self.user.pk)
+        cart.apply_operations([
+            {'op': 'set', 'product_id': product_id, 'quantity': quantity if product_id in existing_ids else 0}
+            for product_id, quantity in quantities.items()
+        ])
+        # The cached cart keeps its own version, the flush is not a change to it
+        state.update(self._read_state(cart), version=state['version'])
+        self._save(state)
+        self._set_dirty(False)
+        logger.info(f"Flushed cart of user {self.user.pk} to the database")
+
+    def _build_item(self, state, cart, product):
+        return CartItem(
+            id=state['item_ids'].get(product.id),
+            cart=cart,
+            product=product,
+            quantity=state['quantities'][product.id],
+            # Items that are not in the database yet get their price snapshot when they are flushed
+            price=state['prices'].get(product.id, product.price),
+        )
+
+    def _build_cart(self, state):
+        if state['cart_id'] is None:
+            return None
+        quantities = {product_id: quantity for product_id, quantity in state['quantities'].items() if quantity}
+        products = Product.objects.in_bulk(quantities)
+        cart = Cart(id=state['cart_id'], user_id=self.user.pk)
+        items = [self._build_item(state, cart, products[product_id]) for product_id in quantities if product_id in products]
+        cart.item_count = sum(item.quantity for item in items)
+        cart.subtotal = sum((item.total_price for item in items), Decimal('0.00'))
+        cart.version = state['version']
+        # Served to CartSerializer as if the items had been prefetched
+        cart._prefetched_objects_cache = {'items': items}
+        return cart
+
+    def get_cart(self):
+        state = self.cache.get(self.key)
+        if state is None:
+            with self._locked():
+                state = self._load()
+                self._save(state)
+        return self._build_cart(state)
+
+    def get_summary(self):
+        return get_cart_summary(self.get_cart() or Cart())
+
+    def add_product(self, product, quantity):
+        changed, state = self._mutate([{'op': 'add', 'product_id': product.id, 'quantity': quantity}])
+        return self._build_item(state, Cart(id=state['cart_id'], user_id=self.user.pk), product)
+
+    def remove_product(self, product_id, quantity=None):
+        product_id = int(product_id)
+        changed, state = self._mutate(
+            [{'op': 'remove', 'product_id': product_id, 'quantity': quantity}], required_product_id=product_id
+        )
+        return changed
+
+    def apply_operations(self, operations):
+        changed, state = self._mutate(operations)
+        return self._build_cart(state)
+
+    def flush(self, idle_after=None):
+        """
+        Writes the cart to the database if it has unsaved changes (and, with `idle_after`, has not been
+        modified for that many seconds). Returns whether anything was written.
+        """
+        with self._locked():
+            state = self.cache.get(self.key)
+            if state is None:
+                self._set_dirty(False)
+                return False
+            if state['dirty_since'] is None:
+                return False
+            if idle_after is not None and time.time() - state['touched_at'] < idle_after:
+                return False
+            self._flush(state)
+            return True
+
+    def _discard(self, product_id):
+        if product_id not in (self.cache.get(self.key) or {}).get('quantities', {}):
+            return
+        with self._locked():
+            state = self.cache.get(self.key)
+            if state is None or product_id not in state['quantities']:
+                return
+            for field in ('quantities', 'item_ids', 'prices'):
+                state[field].pop(product_id, None)
+            state['version'] += 1
+            self._save(state)
+            invalidate_cart_summary(self.user.pk)
+
+    @classmethod
+    def discard_product(cls, product_id):
+        """
+        Takes a product that is being deleted out of the saved carts (see DatabaseCartStorage.discard_product)
+        and out of the cached ones.
+        """
+        user_ids = set(DatabaseCartStorage.discard_product(product_id))
+        # Apart from those, only carts with unsaved changes can hold the product
+        user_ids.update(get_dirty_user_ids())
+        for user in get_user_model().objects.in_bulk(user_ids).values():
+            cls(user)._discard(product_id)
+
+    def clear(self):
+        with self._locked():
+            cart = Cart.objects.filter(user_id=self.user.pk).first()
+            if cart:
+                cart.clear()
+            state = self.cache.get(self.key)
+            self.cache.delete(self.key)
+            if state and state['dirty_since'] is not None:
+                self._set_dirty(False)
+
+
+def get_dirty_user_ids():
+    return Cart.objects.filter(dirty_since__isnull=False).values_list('user_id', flat=True)
+
+
+def discard_deleted_product(sender, instance, **kwargs):
+    # pre_delete receiver for Product, runs in the transaction that deletes the product and its cart items
+    import_string(settings.CART_STORAGE_BACKEND).discard_product(instance.pk)
+
+
+def flush_idle_carts(idle_after=None):
+    """
+    Flushes the dirty cached carts that have been idle for `idle_after` seconds (CART_IDLE_FLUSH_AFTER by
+    default, 0 flushes them all). Returns the number of carts written.
+    """
+    idle_after = settings.CART_IDLE_FLUSH_AFTER if idle_after is None else idle_after
+    storage_class = import_string(settings.CART_STORAGE_BACKEND)
+    user_ids = list(get_dirty_user_ids())
+    users = get_user_model().objects.in_bulk(user_ids)
+
+    flushed = 0
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        try:
+            flushed += storage_class(user).flush(idle_after=idle_after)
+        except Exception as e:
+            logger.exception(f"Failed to flush the cart of user {user_id}: {str(e)}")
+    return flushed
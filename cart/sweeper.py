@@ -0,0 +1,86 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from cart.models import ArchivedCart, Cart, CartItem
+from mutaengine.pagination import CursorPaginator
+
+
+logger = logging.getLogger(__name__)
+
+# Walks the cart_updated_idx index from the oldest cart up
+SWEEP_ORDERING = ('updated_at', 'id')
+
+
+def _archive(carts):
+    items = defaultdict(list)
+    for cart_id, product_id, quantity, price in (
+        CartItem.objects.filter(cart_id__in=[cart.id for cart in carts]).order_by('id')
+        .values_list('cart_id', 'product_id', 'quantity', 'price')
+    ):
+        items[cart_id].append({"product": product_id, "quantity": quantity, "price": price})
+    ArchivedCart.objects.bulk_create([
+        ArchivedCart(
+            user_id=cart.user_id,
+            item_count=cart.item_count,
+            subtotal=cart.subtotal,
+            items=items[cart.id],
+            created_at=cart.created_at,
+            updated_at=cart.updated_at,
+        )
+        for cart in carts
+    ])
+
+
+def sweep_carts(idle_days=None, batch_size=None, archive=False, max_batches=None, pause=0):
+    """
+    Deletes (or, with `archive`, moves to ArchivedCart) the carts not modified for `idle_days` days.
+
+    Candidates are read in `batch_size` pages along the (updated_at, id) index, and each page is removed in
+    its own short transaction that re-checks the age of the carts it locks, skipping the ones a request holds
+    right now (on Postgres). A cart touched since it was read is therefore never removed, and no lock is held
+    for longer than one batch. `pause` seconds of sleep between batches leave room for regular traffic.
+
+    Returns a report with the number of carts and items removed, the elapsed time and the throughput.
+    """
+    idle_days = settings.CART_SWEEP_IDLE_DAYS if idle_days is None else idle_days
+    batch_size = batch_size or settings.CART_SWEEP_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=idle_days)
+    paginator = CursorPaginator(ordering=SWEEP_ORDERING)
+    report = {"carts": 0, "items": 0, "batches": 0}
+    start = time.perf_counter()
+
+    candidates = Cart.objects.filter(updated_at__lt=cutoff).order_by(*SWEEP_ORDERING)
+    last_key = None
+    while max_batches is None or report["batches"] < max_batches:
+        page = candidates.filter(paginator.get_cursor_filter(last_key)) if last_key else candidates
+        ids = list(page.values_list(*SWEEP_ORDERING)[:batch_size])
+        if not ids:
+            break
+        last_key = ids[-1]
+
+        with transaction.atomic():
+            carts = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(id__in=[cart_id for updated_at, cart_id in ids], updated_at__lt=cutoff)
+            )
+            if archive:
+                _archive(carts)
+            cart_ids = [cart.id for cart in carts]
+            items, _ = CartItem.objects.filter(cart_id__in=cart_ids).delete()
+            Cart.objects.filter(id__in=cart_ids).delete()
+
+        report["carts"] += len(cart_ids)
+        report["items"] += items
+        report["batches"] += 1
+        logger.info(f"Cart sweep progress: {report['carts']} carts and {report['items']} items removed")
+        if pause:
+            time.sleep(pause)
+
+    report["seconds"] = time.perf_counter() - start
+    report["carts_per_second"] = report["carts"] / report["seconds"] if report["seconds"] else 0
+    return report
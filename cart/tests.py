@@ -1,3 +1,467 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from cart.apps import check_cart_cache
+from cart.cache import cart_summary_key
+from cart.models import ArchivedCart, Cart, CartItem
+from cart.storage import cache_lock, flush_idle_carts, get_cart_storage
+from cart.sweeper import sweep_carts
+from cart.totals import repair_cart_totals
+from order.models import Order
+from product.models import Product
 
-# Create your tests here.
+
+class CartReadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.cart = Cart.objects.create(user=cls.user)
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price='2.50',
+                description="Description",
+                image="https://example.com/image.png",
+                category='misc',
+                rating=3,
+            )
+            for index in range(10)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_items(self, count):
+        for product in self.products[:count]:
+            self.cart.add_product(product, 2)
+
+    def test_query_count_does_not_depend_on_item_count(self):
+        for count in (1, 10):
+            with self.subTest(items=count):
+                self.cart.clear()
+                self.add_items(count)
+
+                # Cart with its total + items joined with their products
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/cart/')
+
+                self.assertEqual(len(response.data['data']['items']), count)
+                self.assertEqual(response.data['data']['item_count'], count * 2)
+                self.assertEqual(response.data['data']['total_cart_price'], count * 5)
+
+    def test_empty_cart_total(self):
+        response = self.client.get('/api/cart/')
+
+        self.assertEqual(response.data['data']['items'], [])
+        self.assertEqual(response.data['data']['total_cart_price'], 0)
+
+    def test_reading_does_not_create_a_cart(self):
+        user = User.objects.create_user(username='browser', password='Secret@123')
+        self.client.force_authenticate(user)
+
+        response = self.client.get('/api/cart/')
+
+        self.assertEqual(response.data['data']['items'], [])
+        self.assertFalse(Cart.objects.filter(user=user).exists())
+
+
+class CartTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def test_totals_follow_mutations_at_the_added_price(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 3)
+        Product.objects.filter(pk=self.product.pk).update(price='4.00')
+        cart.add_product(self.product, 1)
+        cart.remove_product(self.product.id, 2)
+
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('5.00')))
+        self.assertEqual(CartItem.objects.get(cart=cart).price, Decimal('2.50'))
+
+        cart.clear()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (0, 0))
+
+    def test_repair_fixes_drifted_totals(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 2)
+        Cart.objects.filter(pk=cart.pk).update(item_count=7, subtotal=1)
+
+        self.assertEqual(repair_cart_totals(dry_run=True), [(cart.id, (7, Decimal('1.00')), (2, Decimal('5.00')))])
+        repair_cart_totals()
+
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('5.00')))
+        self.assertEqual(repair_cart_totals(), [])
+
+    def test_repair_rereads_the_locked_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 2)
+        Cart.objects.filter(pk=cart.pk).update(item_count=7, subtotal=1)
+        version = Cart.objects.get(pk=cart.pk).version
+        cache.set(cart_summary_key(self.user.id), {'count': 7}, None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            repaired = repair_cart_totals()
+
+        cart.refresh_from_db()
+        self.assertEqual(repaired, [(cart.id, (7, Decimal('1.00')), (2, Decimal('5.00')))])
+        self.assertEqual(cart.version, version + 1)
+        self.assertIsNone(cache.get(cart_summary_key(self.user.id)))
+
+    def test_repair_keeps_changes_made_after_the_scan(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 2)
+        Cart.objects.filter(pk=cart.pk).update(item_count=7, subtotal=1)
+        select_for_update = Cart.objects.select_for_update
+
+        def add_then_lock():
+            # A mutation committed between the scan and the repair of the cart
+            cart.add_product(self.product, 1)
+            return select_for_update()
+
+        with mock.patch.object(Cart.objects, 'select_for_update', side_effect=add_then_lock):
+            repair_cart_totals()
+
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (3, Decimal('7.50')))
+
+
+class CartSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_unchanged_cart_is_not_modified_without_queries(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 2)
+
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.data['data'], {'count': 2, 'subtotal': Decimal('5.00'), 'version': 1})
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_mutation_invalidates_the_summary(self):
+        cart = Cart.objects.create(user=self.user)
+        etag = self.client.get('/api/cart/summary/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.add_product(self.product, 1)
+
+        response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['count'], 1)
+
+    def test_deleting_a_product_updates_the_carts_holding_it(self):
+        other = Product.objects.create(
+            title="Gadget", price='1.00', description="Description", image="https://example.com/image.png",
+            category='misc', rating=3,
+        )
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.product, 2)
+        cart.add_product(other, 1)
+        self.assertEqual(self.client.get('/api/cart/summary/').data['data']['count'], 3)
+
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_superuser(username='admin', password='Secret@123'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(admin.delete(f'/api/products/{self.product.id}/').status_code, 204)
+
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.data['data'], {'count': 1, 'subtotal': Decimal('1.00'), 'version': 3})
+        self.assertEqual(repair_cart_totals(dry_run=True), [])
+
+
+class CartSweeperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def make_cart(self, username, idle_days):
+        cart = Cart.objects.create(user=User.objects.create_user(username=username, password='Secret@123'))
+        cart.add_product(self.product, 2)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=idle_days))
+        return cart
+
+    def test_removes_only_idle_carts_in_batches(self):
+        idle = [self.make_cart(f"idle{index}", idle_days=40) for index in range(5)]
+        active = self.make_cart('active', idle_days=1)
+
+        report = sweep_carts(idle_days=30, batch_size=2)
+
+        self.assertEqual((report['carts'], report['items'], report['batches']), (5, 5, 3))
+        self.assertEqual(list(Cart.objects.values_list('id', flat=True)), [active.id])
+        self.assertFalse(CartItem.objects.filter(cart_id__in=[cart.id for cart in idle]).exists())
+
+    def test_archives_removed_carts(self):
+        cart = self.make_cart('idle', idle_days=40)
+
+        sweep_carts(idle_days=30, archive=True)
+
+        archived = ArchivedCart.objects.get()
+        self.assertEqual((archived.user_id, archived.item_count, archived.subtotal), (cart.user_id, 2, Decimal('5.00')))
+        self.assertEqual(archived.items, [{'product': self.product.id, 'quantity': 2, 'price': '2.50'}])
+        self.assertFalse(Cart.objects.exists())
+
+
+class ConcurrentCartMutationTests(TransactionTestCase):
+    threads = 8
+    requests_per_thread = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("In-memory SQLite reports 'table is locked' instead of waiting for concurrent writers")
+        self.user = User.objects.create_user(username='shopper', password='Secret@123')
+        self.product = Product.objects.create(
+            title="Widget",
+            price='1.00',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def run_concurrently(self, action):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                for _ in range(self.requests_per_thread):
+                    statuses.append(action(client).status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return statuses
+
+    def test_concurrent_adds_are_not_lost(self):
+        statuses = self.run_concurrently(
+            lambda client: client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 1})
+        )
+
+        self.assertEqual(set(statuses), {200})
+        items = CartItem.objects.filter(cart__user=self.user, product=self.product)
+        self.assertEqual(items.count(), 1)
+        self.assertEqual(items.get().quantity, self.threads * self.requests_per_thread)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (self.threads * self.requests_per_thread,) * 2)
+
+    def test_concurrent_removes_are_not_lost(self):
+        cart = Cart.objects.create(user=self.user)
+        total = self.threads * self.requests_per_thread
+        cart.add_product(self.product, total + 5)
+
+        statuses = self.run_concurrently(
+            lambda client: client.delete('/api/cart/', {'product_id': self.product.id, 'quantity': 1})
+        )
+
+        self.assertEqual(set(statuses), {204})
+        self.assertEqual(CartItem.objects.get(cart=cart, product=self.product).quantity, 5)
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (5, 5))
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price='1.00',
+                description="Description",
+                image="https://example.com/image.png",
+                category='misc',
+                rating=3,
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_applies_operations_in_order(self):
+        first, second, third = (product.id for product in self.products)
+        cart = Cart.objects.create(user=self.user)
+        cart.add_product(self.products[1], 3)
+        cart.add_product(self.products[2], 1)
+
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': first, 'quantity': 2},
+            {'op': 'add', 'product_id': first},
+            {'op': 'remove', 'product_id': second, 'quantity': 1},
+            {'op': 'set', 'product_id': third, 'quantity': 0},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        quantities = {item['product']: item['quantity'] for item in response.data['data']['items']}
+        self.assertEqual(quantities, {first: 3, second: 2})
+        self.assertEqual(response.data['data']['total_cart_price'], 5)
+        self.assertEqual(repair_cart_totals(dry_run=True), [])
+
+    def test_rejects_unknown_products_without_changes(self):
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': self.products[0].id},
+            {'op': 'add', 'product_id': 999},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    @override_settings(CART_BATCH_MAX_OPERATIONS=2)
+    def test_rejects_too_many_operations(self):
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': product.id} for product in self.products
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('operations', response.data['data'])
+        self.assertFalse(CartItem.objects.exists())
+
+
+@override_settings(CART_STORAGE_BACKEND='cart.storage.CacheCartStorage', CART_FLUSH_INTERVAL=3600)
+class CacheCartStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.00',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_mutations_stay_in_cache_until_flushed(self):
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 1})
+        self.assertIsNotNone(Cart.objects.get(user=self.user).dirty_since)
+
+        # Only the product lookup, the cart itself is not written
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(response.data['data']['quantity'], 3)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['data']['items'][0]['quantity'], 3)
+        self.assertEqual(response.data['data']['total_cart_price'], 6)
+
+        self.assertEqual(flush_idle_carts(idle_after=0), 1)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 3)
+        self.assertIsNone(Cart.objects.get(user=self.user).dirty_since)
+        self.assertEqual(flush_idle_carts(idle_after=0), 0)
+
+    def test_lock_outliving_its_ttl_is_reported(self):
+        with self.assertLogs('cart.storage', 'WARNING'):
+            with cache_lock(cache, 'cart:lock:test'):
+                # What expiring after CART_LOCK_TTL does
+                cache.delete('cart:lock:test')
+
+    def test_checkout_flushes_the_cart(self):
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 2})
+
+        with mock.patch('order.views.create_checkout_session', return_value={'id': 'cs_test', 'url': 'https://pay'}):
+            response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().total_amount, 4)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+
+    def test_summary_is_invalidated_after_the_state_is_saved(self):
+        versions = []
+        storage = get_cart_storage(self.user)
+        with mock.patch('cart.storage.invalidate_cart_summary', side_effect=lambda user_id: versions.append(
+            cache.get(storage.key)['version']
+        )):
+            storage.add_product(self.product, 1)
+
+        # A summary read right after the invalidation already sees the new version
+        self.assertEqual(versions, [1])
+
+    def test_deleted_product_leaves_the_cached_cart(self):
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(self.client.get('/api/cart/summary/').data['data']['count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+
+        self.assertEqual(self.client.get('/api/cart/').data['data']['items'], [])
+        self.assertEqual(self.client.get('/api/cart/summary/').data['data']['count'], 0)
+        flush_idle_carts(idle_after=0)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartCacheCheckTests(SimpleTestCase):
+    redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+
+    def get_error_ids(self):
+        return [error.id for error in check_cart_cache(None)]
+
+    def test_database_storage_needs_nothing(self):
+        self.assertEqual(self.get_error_ids(), [])
+
+    @override_settings(CART_STORAGE_BACKEND='cart.storage.CacheCartStorage')
+    def test_write_behind_storage_refuses_evicting_caches(self):
+        self.assertEqual(self.get_error_ids(), ['cart.E001'])
+
+        with override_settings(CACHES=self.redis):
+            self.assertEqual(self.get_error_ids(), [])
+        with override_settings(CACHES=self.redis, CART_CACHE_TIMEOUT=60, CART_IDLE_FLUSH_AFTER=300):
+            self.assertEqual(self.get_error_ids(), ['cart.E002'])
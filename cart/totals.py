@@ -0,0 +1,76 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from cart.cache import invalidate_cart_summary
+from cart.models import Cart, CartItem
+
+
+def _items_total(item_model, expression, output_field, empty):
+    # Correlated subquery per cart, so the totals can be compared without grouping the carts themselves
+    return Coalesce(
+        Subquery(
+            item_model.objects
+            .filter(cart=OuterRef('pk'))
+            .order_by()
+            .values('cart')
+            .annotate(total=Sum(expression, output_field=output_field))
+            .values('total')
+        ),
+        Value(empty),
+        output_field=output_field,
+    )
+
+
+def with_expected_totals(cart_model=Cart, item_model=CartItem):
+    """
+    Annotates every cart with the item_count and subtotal recomputed from its items.
+    """
+    subtotal_field = DecimalField(max_digits=12, decimal_places=2)
+    line_total = ExpressionWrapper(F('quantity') * F('price'), output_field=subtotal_field)
+    return cart_model.objects.annotate(
+        expected_item_count=_items_total(item_model, F('quantity'), IntegerField(), 0),
+        expected_subtotal=_items_total(item_model, line_total, subtotal_field, Decimal('0.00')),
+    )
+
+
+def _get_drift(carts):
+    drifted = (
+        carts
+        .exclude(item_count=F('expected_item_count'), subtotal=F('expected_subtotal'))
+        .order_by('id')
+        .values_list('id', 'item_count', 'subtotal', 'expected_item_count', 'expected_subtotal')
+    )
+    return [
+        (cart_id, (item_count, subtotal), (expected_count, expected_subtotal))
+        for cart_id, item_count, subtotal, expected_count, expected_subtotal in drifted
+    ]
+
+
+def repair_cart_totals(dry_run=False):
+    """
+    Finds the carts whose stored totals disagree with their items and, unless `dry_run`, rewrites them.
+    Returns a list of (cart id, (stored count, stored subtotal), (expected count, expected subtotal)).
+
+    Each cart is locked before its totals are recomputed and written: mutations move the totals with relative
+    UPDATEs of the cart row, so one in flight is either counted in the recomputed totals or applied on top of them.
+    """
+    drift = _get_drift(with_expected_totals())
+    if dry_run:
+        return drift
+
+    repaired = []
+    for cart_id, stored, expected in drift:
+        with transaction.atomic():
+            user_id = Cart.objects.select_for_update().filter(pk=cart_id).values_list('user_id', flat=True).first()
+            # Read once the lock is held; the cart may have been fixed (or deleted) since the scan
+            cart_drift = _get_drift(with_expected_totals().filter(pk=cart_id))
+            if user_id is None or not cart_drift:
+                continue
+            expected_count, expected_subtotal = cart_drift[0][2]
+            Cart.objects.filter(pk=cart_id).update(
+                item_count=expected_count, subtotal=expected_subtotal, version=F('version') + 1
+            )
+            invalidate_cart_summary(user_id)
+        repaired.extend(cart_drift)
+    return repaired
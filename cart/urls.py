@@ -1,8 +1,10 @@
-from cart.views import CartView
+from cart.views import CartView, CartBatchView, CartSummaryView
 from django.urls import path
 
 app_name = 'cart'
 
 urlpatterns = [
     path('cart/', CartView.as_view(), name='cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart_batch'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart_summary'),
 ]
@@ -1,10 +1,13 @@
 import logging
-from cart.models import Cart, CartItem
-from cart.serializers import CartSerializer, CartItemSerializer
+from decimal import Decimal
+from cart.cache import get_cached_cart_summary, set_cached_cart_summary
+from cart.serializers import CartBatchSerializer, CartSerializer, CartItemSerializer
+from cart.storage import get_cart_storage
 from product.models import Product
 from mutaengine.base_view import BaseAPIView
-from mutaengine.utils import custom_response
+from mutaengine.utils import custom_response, get_not_modified_response, make_etag, set_validator_headers
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework import status, exceptions
 
 
@@ -15,18 +18,34 @@ class CartView(BaseAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_cart(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        cart = get_cart_storage(request.user).get_cart()
+        if cart:
+            data = CartSerializer(cart).data
+        else:
+            # Users who never added anything get an empty cart without a row being created for them
+            data = {"id": None, "user": request.user.id, "items": [], "item_count": 0, "total_cart_price": Decimal('0.00')}
         logger.info(f"User {request.user.username} retrieved cart successfully")
         return custom_response(
             message="Cart retrieved successfully",
-            data=serializer.data,
+            data=data,
             status_code=status.HTTP_200_OK
         )
 
+    def get_quantity(self, request, default=None):
+        quantity = request.data.get('quantity') or default
+        if quantity is None:
+            return None
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({"quantity": "A valid integer is required."})
+        if quantity < 1:
+            raise exceptions.ValidationError({"quantity": "Quantity must be greater than 0."})
+        return quantity
+
     def add_to_cart(self, request):
         product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity') or 1
+        quantity = self.get_quantity(request, default=1)
 
         if not product_id:
             logger.exception(f"{request.user.username}'s request is missing product_id")
@@ -41,11 +60,7 @@ class CartView(BaseAPIView):
             logger.exception(f"{request.user.username} tried to add product with id {product_id}")
             raise exceptions.NotFound
         
-        cart, created = Cart.objects.get_or_create(user=request.user)
-
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        cart_item.quantity = cart_item.quantity + int(quantity)
-        cart_item.save()
+        cart_item = get_cart_storage(request.user).add_product(product, quantity)
         cart_item_data = CartItemSerializer(cart_item).data
         
         logger.info(f"Cart updated by user: {request.user.username}\nAdded Cart Item: {cart_item_data}")
@@ -57,7 +72,7 @@ class CartView(BaseAPIView):
 
     def remove_from_cart(self, request):
         product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity')
+        quantity = self.get_quantity(request)
 
         if not product_id:
             logger.exception(f"{request.user.username}'s request is missing product_id")
@@ -67,27 +82,14 @@ class CartView(BaseAPIView):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
 
-        cart = Cart.objects.filter(user=request.user).first()
-        if not cart:
-            logger.info(f"{request.user.username} has no cart")
-            raise exceptions.NotFound
-        
-        cart_item = CartItem.objects.filter(cart=cart, product__id=product_id).first()
-        if not cart_item:
+        if not get_cart_storage(request.user).remove_product(product_id, quantity):
             logger.info(f"{request.user.username} tried to remove invalid cart item: {product_id}")
             return custom_response(
                 message="Product not in cart",
                 data={},
                 status_code=status.HTTP_404_NOT_FOUND
             )
-
-        if not quantity or cart_item.quantity < quantity:
-            logger.info(f"{request.user.username} removed product with id({cart_item.product.id}) from the cart")
-            cart_item.delete()
-        else:
-            cart_item.quantity -= quantity
-            cart_item.save()
-            logger.info(f"{request.user.username} decreased product with id({cart_item.product.id})'s quantity by {quantity}")
+        logger.info(f"{request.user.username} removed {quantity or 'all'} of product with id({product_id}) from the cart")
 
         return custom_response(
             message="Product removed from cart",
@@ -103,3 +105,66 @@ class CartView(BaseAPIView):
 
     def delete(self, request, *args, **kwargs):
         return self.handle_request(request, self.remove_from_cart, *args, **kwargs)
+
+
+class CartSummaryView(BaseAPIView):
+    # The user comes from the token claims alone, so a cached summary is served without touching the database
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_summary(self, request):
+        user_id = request.user.id
+        summary = get_cached_cart_summary(user_id)
+        if summary is None:
+            summary = get_cart_storage(request.user).get_summary()
+            set_cached_cart_summary(user_id, summary)
+
+        etag = make_etag('cart-summary', user_id, summary['count'], summary['subtotal'], summary['version'])
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        response = custom_response(
+            message="Cart summary retrieved successfully",
+            data=summary,
+            status_code=status.HTTP_200_OK
+        )
+        return set_validator_headers(response, etag)
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.get_summary, *args, **kwargs)
+
+
+class CartBatchView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def apply_operations(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.info(f"{request.user.username} sent an invalid cart batch: {serializer.errors}")
+            return custom_response(
+                message="Validation Error",
+                data=serializer.errors,
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        operations = serializer.validated_data['operations']
+
+        product_ids = {operation['product_id'] for operation in operations}
+        existing_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        missing_ids = sorted(product_ids - existing_ids)
+        if missing_ids:
+            logger.info(f"{request.user.username} sent a cart batch with unknown products: {missing_ids}")
+            raise exceptions.NotFound(f"Products not found: {', '.join(map(str, missing_ids))}")
+
+        cart = get_cart_storage(request.user).apply_operations(operations)
+        serializer = CartSerializer(cart)
+
+        logger.info(f"{request.user.username} applied {len(operations)} cart operations")
+        return custom_response(
+            message="Cart updated successfully",
+            data=serializer.data,
+            status_code=status.HTTP_200_OK
+        )
+
+    def post(self, request, *args, **kwargs):
+        return self.handle_request(request, self.apply_operations, *args, **kwargs)
@@ -19,6 +19,13 @@ class BaseAPIView(views.APIView):
                 data={"error": str(auth_error)},
                 status_code=status.HTTP_401_UNAUTHORIZED
             )
+        except exceptions.ValidationError as validation_error:
+            logger.info(f"Invalid request: {str(validation_error)}")
+            return custom_response(
+                message="Validation Error",
+                data=validation_error.detail,
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
         except exceptions.NotFound as not_found_error:
             logger.info(f"Object not Found: {str(not_found_error)}")
             return custom_response(
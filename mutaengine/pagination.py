@@ -0,0 +1,122 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework import exceptions
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, which would skip rows sharing the millisecond
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key values of the last row of a page into an opaque, url-safe cursor.
+    """
+    payload = json.dumps(values, cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decodes a cursor produced by `encode_cursor`. Raises ValidationError if it is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise exceptions.ValidationError({"cursor": "Invalid cursor."})
+    if not isinstance(values, list) or len(values) != size:
+        raise exceptions.ValidationError({"cursor": "Invalid cursor."})
+    return values
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over an indexed, unique ordering.
+
+    `ordering` is a tuple of field names (prefixed with '-' for descending) and must end
+    with a unique field (usually 'id') so every row has a distinct position. Each page is
+    fetched with `WHERE (sort key) > (last seen key) ORDER BY ... LIMIT n`, so the cost of
+    a page does not depend on how deep into the result set it is.
+    """
+
+    def __init__(self, ordering=('id',), default_limit=None, max_limit=None):
+        self.ordering = tuple(ordering)
+        self._default_limit = default_limit
+        self._max_limit = max_limit
+
+    @property
+    def default_limit(self):
+        return self._default_limit or settings.PAGINATION_DEFAULT_LIMIT
+
+    @property
+    def max_limit(self):
+        return self._max_limit or settings.PAGINATION_MAX_LIMIT
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_limit(self, request):
+        limit = request.query_params.get('limit')
+        if limit is None:
+            return min(self.default_limit, self.max_limit)
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise exceptions.ValidationError({"limit": "Limit must be an integer."})
+        if limit < 1:
+            raise exceptions.ValidationError({"limit": "Limit must be greater than 0."})
+        return min(limit, self.max_limit)
+
+    def get_cursor_filter(self, values):
+        # (a, b, c) after (x, y, z) => a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            clause = Q(**{f"{name}__{lookup}": values[index]})
+            for previous, value in zip(self.fields[:index], values[:index]):
+                clause &= Q(**{previous: value})
+            condition |= clause
+        return condition
+
+    def paginate(self, request, queryset):
+        """
+        Returns the rows of the requested page and the cursor of the next page (None on the last page).
+
+        `queryset` may be a model or a `.values()` queryset; in both cases the sort key fields must be fetched.
+        """
+        limit = self.get_limit(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            values = decode_cursor(cursor, len(self.ordering))
+            try:
+                queryset = queryset.filter(self.get_cursor_filter(values))
+            except (DjangoValidationError, ValueError, TypeError):
+                # The cursor was issued for a different ordering
+                raise exceptions.ValidationError({"cursor": "Invalid cursor."})
+
+        rows = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(self.get_key(rows[-1]))
+        return rows, next_cursor
+
+    def get_key(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
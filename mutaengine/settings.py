@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 import dj_database_url
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -98,6 +100,134 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# The product cache version, idempotent replays, cart summaries and published checkout statuses only work when
+# every server process shares the cache, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache with
+# CACHE_LOCATION=redis://<host>:6379. The process-local default is only accepted with DEBUG or while running the
+# tests, anywhere else the product.E001 check refuses to start.
+CACHE_ALLOW_PROCESS_LOCAL = DEBUG or sys.argv[1:2] == ['test']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'mutaengine'),
+    }
+}
+
+# Seconds a cached product list/detail response is kept (entries are also dropped on any catalog change)
+PRODUCT_CACHE_TIMEOUT = int(os.getenv('PRODUCT_CACHE_TIMEOUT', 300))
+
+
+# Maximum number of ids accepted by /api/products/batch/
+PRODUCT_BATCH_MAX_IDS = int(os.getenv('PRODUCT_BATCH_MAX_IDS', 100))
+
+# Product bulk import
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv('PRODUCT_IMPORT_BATCH_SIZE', 1000))
+PRODUCT_IMPORT_MAX_REPORTED_ERRORS = int(os.getenv('PRODUCT_IMPORT_MAX_REPORTED_ERRORS', 1000))
+
+# Lower bounds of the rating and price facet buckets. Run `manage.py rebuild_product_facets` after changing them.
+PRODUCT_RATING_BUCKETS = [0, 1, 2, 3, 4, 5]
+PRODUCT_PRICE_BUCKETS = [0, 10, 25, 50, 100, 250, 500, 1000]
+
+# Rows fetched per database round-trip by the streaming product export
+PRODUCT_EXPORT_CHUNK_SIZE = int(os.getenv('PRODUCT_EXPORT_CHUNK_SIZE', 2000))
+
+
+# Maximum number of operations accepted by /api/cart/batch/
+CART_BATCH_MAX_OPERATIONS = int(os.getenv('CART_BATCH_MAX_OPERATIONS', 100))
+
+# Where live carts are kept: 'cart.storage.DatabaseCartStorage' (default) or 'cart.storage.CacheCartStorage',
+# which keeps them in the CART_CACHE_ALIAS cache and writes them to the database behind the requests.
+# CART_CACHE_TIMEOUT must stay well above CART_IDLE_FLUSH_AFTER and `flush_carts` must run more often than
+# that, or idle carts expire from the cache before they are written. Unsaved carts only live in that cache, so
+# it must never evict entries: use Redis with maxmemory-policy noeviction, not locmem (which culls at MAX_ENTRIES)
+# or memcached. The cart.E001 system check refuses to start with an evicting backend.
+CART_STORAGE_BACKEND = os.getenv('CART_STORAGE_BACKEND', 'cart.storage.DatabaseCartStorage')
+CART_CACHE_ALIAS = os.getenv('CART_CACHE_ALIAS', 'default')
+CART_CACHE_TIMEOUT = int(os.getenv('CART_CACHE_TIMEOUT', 86400))
+CART_FLUSH_INTERVAL = int(os.getenv('CART_FLUSH_INTERVAL', 60))
+CART_IDLE_FLUSH_AFTER = int(os.getenv('CART_IDLE_FLUSH_AFTER', 300))
+# A cart mutation waits up to CART_LOCK_TIMEOUT seconds for the cart's lock. The lock expires after CART_LOCK_TTL
+# seconds in case its holder died; keep it above the slowest flush of a cart to the database.
+CART_LOCK_TIMEOUT = int(os.getenv('CART_LOCK_TIMEOUT', 5))
+CART_LOCK_TTL = int(os.getenv('CART_LOCK_TTL', 60))
+
+# Lifetime of the cached /api/cart/summary/ responses. Mutations drop the entry, the timeout only bounds
+# how long a summary cached by a read racing a mutation can stay stale.
+CART_SUMMARY_CACHE_TIMEOUT = int(os.getenv('CART_SUMMARY_CACHE_TIMEOUT', 300))
+
+# `manage.py sweep_carts` removes carts not modified for this many days, this many carts per transaction
+CART_SWEEP_IDLE_DAYS = int(os.getenv('CART_SWEEP_IDLE_DAYS', 30))
+CART_SWEEP_BATCH_SIZE = int(os.getenv('CART_SWEEP_BATCH_SIZE', 500))
+
+# Checkout responses are kept for retries carrying the same Idempotency-Key for IDEMPOTENCY_KEY_TTL seconds.
+# A retry of a request still in progress waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds before getting a 409,
+# and a request holding a key for more than IDEMPOTENCY_LOCK_TIMEOUT seconds is considered dead. Synchronous
+# checkout holds its key across the gateway call, so it must outlast PAYMENT_GATEWAY_MAX_CALL_TIME (checked below).
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 5))
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv('IDEMPOTENCY_POLL_INTERVAL', 0.1))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 180))
+
+# Lifetime of the Stripe Checkout Sessions (Stripe accepts 30 minutes to 24 hours). A pending order for an
+# unchanged cart hands its session out again unless it expires within CHECKOUT_SESSION_REUSE_MARGIN seconds.
+CHECKOUT_SESSION_TTL = int(os.getenv('CHECKOUT_SESSION_TTL', 3600))
+CHECKOUT_SESSION_REUSE_MARGIN = int(os.getenv('CHECKOUT_SESSION_REUSE_MARGIN', 300))
+
+# 'sync' creates the gateway session inside POST /api/order/. 'async' saves the order as PENDING_SESSION and
+# answers 202 right away; CHECKOUT_WORKERS background threads per process create the session (0 runs it inline
+# after the commit) and clients poll GET /api/order/<id>/status/?wait=<seconds> for the payment URL.
+# A waiting poll holds its server worker for up to CHECKOUT_STATUS_MAX_WAIT seconds and only sees the outcome
+# early through a cache shared with the checkout workers; keep it short on sync workers (e.g. gunicorn's default).
+CHECKOUT_MODE = os.getenv('CHECKOUT_MODE', 'sync')
+CHECKOUT_WORKERS = int(os.getenv('CHECKOUT_WORKERS', 4))
+CHECKOUT_STATUS_MAX_WAIT = float(os.getenv('CHECKOUT_STATUS_MAX_WAIT', 2))
+CHECKOUT_STATUS_POLL_INTERVAL = float(os.getenv('CHECKOUT_STATUS_POLL_INTERVAL', 0.1))
+# A worker creating a gateway session holds the order for this many seconds, then another worker (or
+# resume_checkout_sessions) may take it over. It must outlast PAYMENT_GATEWAY_MAX_CALL_TIME (checked below).
+CHECKOUT_SESSION_LEASE = int(os.getenv('CHECKOUT_SESSION_LEASE', 120))
+
+# Payment provider behind checkout and the webhook: 'order.gateways.StripeGateway', or 'order.gateways.FakeGateway'
+# for load tests and offline benchmarks (no network calls, FAKE_GATEWAY_* latency and failure injection).
+PAYMENT_GATEWAY_BACKEND = os.getenv('PAYMENT_GATEWAY_BACKEND', 'order.gateways.StripeGateway')
+PAYMENT_GATEWAY_POOL_SIZE = int(os.getenv('PAYMENT_GATEWAY_POOL_SIZE', 10))
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = float(os.getenv('PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.05))
+PAYMENT_GATEWAY_READ_TIMEOUT = float(os.getenv('PAYMENT_GATEWAY_READ_TIMEOUT', 20))
+PAYMENT_GATEWAY_MAX_RETRIES = int(os.getenv('PAYMENT_GATEWAY_MAX_RETRIES', 2))
+# Longest a gateway call can take: every attempt timing out, plus the Stripe client's backoff between attempts
+# (at most 2 seconds each)
+PAYMENT_GATEWAY_MAX_CALL_TIME = (
+    (PAYMENT_GATEWAY_CONNECT_TIMEOUT + PAYMENT_GATEWAY_READ_TIMEOUT) * (PAYMENT_GATEWAY_MAX_RETRIES + 1)
+    + 2 * PAYMENT_GATEWAY_MAX_RETRIES
+)
+# A checkout still waiting on the gateway would otherwise be taken for dead and a retry would create a second
+# session (and order)
+for name, timeout in [
+    ('IDEMPOTENCY_LOCK_TIMEOUT', IDEMPOTENCY_LOCK_TIMEOUT), ('CHECKOUT_SESSION_LEASE', CHECKOUT_SESSION_LEASE)
+]:
+    if timeout <= PAYMENT_GATEWAY_MAX_CALL_TIME:
+        raise ImproperlyConfigured(
+            f"{name} must be greater than the longest payment gateway call ({PAYMENT_GATEWAY_MAX_CALL_TIME:g}s)."
+        )
+FAKE_GATEWAY_LATENCY = float(os.getenv('FAKE_GATEWAY_LATENCY', 0.2))
+FAKE_GATEWAY_JITTER = float(os.getenv('FAKE_GATEWAY_JITTER', 0.1))
+FAKE_GATEWAY_FAILURE_RATE = float(os.getenv('FAKE_GATEWAY_FAILURE_RATE', 0))
+
+# The webhook view only stores verified events, `manage.py process_webhooks` runs WEBHOOK_WORKERS threads that
+# handle them. Failed events are retried with exponential backoff (WEBHOOK_RETRY_BASE_DELAY doubling up to
+# WEBHOOK_RETRY_MAX_DELAY seconds) up to WEBHOOK_MAX_ATTEMPTS times; an event held by a worker for more than
+# WEBHOOK_LEASE_TIMEOUT seconds is taken over by another one.
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 1))
+WEBHOOK_CLAIM_BATCH = int(os.getenv('WEBHOOK_CLAIM_BATCH', 10))
+WEBHOOK_LEASE_TIMEOUT = int(os.getenv('WEBHOOK_LEASE_TIMEOUT', 300))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_BASE_DELAY = float(os.getenv('WEBHOOK_RETRY_BASE_DELAY', 10))
+WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('WEBHOOK_RETRY_MAX_DELAY', 3600))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -171,6 +301,10 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Pagination
+PAGINATION_DEFAULT_LIMIT = int(os.getenv('PAGINATION_DEFAULT_LIMIT', 20))
+PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 100))
+
 # Simple JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
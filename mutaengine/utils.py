@@ -1,3 +1,4 @@
+import hashlib
 import requests
 import tempfile
 import logging
@@ -15,6 +16,9 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.pagesizes import letter
 
 from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
 
 logger = logging.getLogger(__name__)
@@ -40,6 +44,41 @@ def custom_response(status_code: int, message: str, data=None):
     )
     
     
+def make_etag(*parts):
+    """
+    Builds a strong ETag from the values that identify a representation (ids, timestamps, counts...).
+    """
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def set_validator_headers(response, etag, last_modified=None):
+    """
+    Sets the ETag and, when known, the Last-Modified headers on a response.
+
+    :param last_modified: datetime of the last change to the representation
+    """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def get_not_modified_response(request, etag, last_modified=None):
+    """
+    Evaluates If-None-Match/If-Modified-Since (and If-Match/If-Unmodified-Since) against the validators.
+
+    :return: a 304 (or 412) response carrying the validators, or None if the full response should be sent
+    """
+    validators = set_validator_headers(HttpResponse(), etag, last_modified)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+        response=validators
+    )
+    return None if response is validators else response
+
+
 def send_password_reset_email(user, reset_link):
     subject = "Password Reset Request"
     html_content = render_to_string('password_reset_email.html', {
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from order.gateways import get_payment_gateway
+from order.models import Order
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def create_checkout_session(order_id, total_amount):
+    """
+    Creates the hosted payment page for an order through the payment gateway and returns it as {'id', 'url'}.
+    `order_id` is None when the order is only saved once the session exists (synchronous checkout).
+    """
+    return get_payment_gateway().create_checkout_session(order_id, total_amount)
+
+
+def checkout_status_key(order_id):
+    return f"order:checkout:{order_id}"
+
+
+def get_checkout_status(order):
+    return {"order_id": order.id, "status": order.status, "checkout_url": order.payment_url}
+
+
+def publish_checkout_status(order, user_id):
+    # Read by the (long-)polling status endpoint, so waiting clients don't have to query the database
+    cache.set(checkout_status_key(order.id), (user_id, get_checkout_status(order)), settings.CHECKOUT_SESSION_TTL)
+
+
+def claim_checkout_session(order_id):
+    """
+    Takes the lease on creating the gateway session of a PENDING_SESSION order. Returns the lease time, or None
+    if the order is in another state or another worker holds a lease younger than CHECKOUT_SESSION_LEASE seconds.
+    """
+    now = timezone.now()
+    claimed = Order.objects.filter(pk=order_id, status="PENDING_SESSION").filter(
+        Q(session_claimed_at__isnull=True)
+        | Q(session_claimed_at__lte=now - timedelta(seconds=settings.CHECKOUT_SESSION_LEASE))
+    ).update(session_claimed_at=now)
+    return now if claimed else None
+
+
+def complete_checkout_session(order_id):
+    """
+    Creates the gateway session of an order waiting in PENDING_SESSION and moves it to PENDING with its
+    payment URL, or to FAILED if the gateway call fails. Orders in any other state, or being completed by
+    another worker, are left alone.
+    """
+    claimed_at = claim_checkout_session(order_id)
+    if claimed_at is None:
+        return
+    order = Order.objects.get(pk=order_id)
+    try:
+        session = create_checkout_session(order.id, order.total_amount)
+    except Exception as e:
+        logger.error(f"Creating the checkout session of Order#{order_id} failed: {str(e)}")
+        changes = {"status": "FAILED"}
+    else:
+        changes = {"status": "PENDING", "external_order_id": session['id'], "payment_url": session['url']}
+
+    # Only while still holding the lease: a worker that took the order over may already have written its session
+    if Order.objects.filter(pk=order_id, status="PENDING_SESSION", session_claimed_at=claimed_at).update(**changes):
+        for field, value in changes.items():
+            setattr(order, field, value)
+        logger.info(f"Checkout session of Order#{order_id} completed with status {order.status}")
+    else:
+        logger.warning(f"Lost the checkout session lease of Order#{order_id}, keeping what the other worker wrote")
+        order.refresh_from_db()
+    # Published from what is in the database, so waiting clients never get a session the order doesn't have
+    publish_checkout_status(order, order.user_id)
+
+
+def _run_in_worker(order_id):
+    try:
+        complete_checkout_session(order_id)
+    except Exception as e:
+        logger.exception(f"Checkout worker failed for Order#{order_id}: {str(e)}")
+    finally:
+        # Worker threads hold their own connection, don't leave it open between jobs
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CHECKOUT_WORKERS, thread_name_prefix='checkout')
+        return _executor
+
+
+def submit_checkout_session(order_id):
+    """
+    Schedules the gateway session of an order once the current transaction commits. With CHECKOUT_WORKERS = 0
+    the session is created inline instead (development and tests).
+    """
+    if settings.CHECKOUT_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_worker, order_id))
+    else:
+        transaction.on_commit(lambda: complete_checkout_session(order_id))
+
+
+def wait_for_checkout_status(order_id, timeout):
+    """
+    Returns the (user id, status) published for an order, polling the cache for up to `timeout` seconds while
+    its session is still being created. Returns None if nothing was published.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        published = cache.get(checkout_status_key(order_id))
+        if (published and published[1]["status"] != "PENDING_SESSION") or time.monotonic() >= deadline:
+            return published
+        time.sleep(settings.CHECKOUT_STATUS_POLL_INTERVAL)
@@ -0,0 +1,48 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import exceptions
+from order.models import Order
+
+
+# Newest first, `id` breaks ties between orders created at the same instant. Backed by order_user_created_idx.
+ORDER_HISTORY_ORDERING = ('-created_at', '-id')
+ORDER_STATUSES = [value for value, label in Order.ORDER_STATUS_CHOICES]
+
+
+def _parse_datetime(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = day and datetime.combine(day, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise exceptions.ValidationError({name: "Must be an ISO 8601 date or datetime."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_orders(queryset, params):
+    """
+    Applies the `status`, `created_after` (inclusive) and `created_before` (exclusive) query parameters
+    to an Order queryset.
+    """
+    order_status = params.get('status')
+    created_after = _parse_datetime(params, 'created_after')
+    created_before = _parse_datetime(params, 'created_before')
+
+    if order_status:
+        if order_status.upper() not in ORDER_STATUSES:
+            raise exceptions.ValidationError({"status": f"Must be one of: {', '.join(ORDER_STATUSES)}."})
+        queryset = queryset.filter(status=order_status.upper())
+    if created_after:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before:
+        queryset = queryset.filter(created_at__lt=created_before)
+    return queryset
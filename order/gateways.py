@@ -0,0 +1,179 @@
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+import uuid
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class WebhookVerificationError(Exception):
+    """
+    The webhook payload could not be parsed or its signature does not match.
+    """
+    pass
+
+
+def get_payment_gateway():
+    """
+    Returns the payment gateway (PAYMENT_GATEWAY_BACKEND). One instance per backend and process, so its
+    HTTP connections are reused across requests.
+    """
+    return _load_gateway(settings.PAYMENT_GATEWAY_BACKEND)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_gateway(backend):
+    return import_string(backend)()
+
+
+class PaymentGateway:
+    """
+    What checkout needs from a payment provider: a hosted payment page per order, and verified webhook events.
+    """
+    def create_checkout_session(self, order_id, total_amount):
+        """
+        Creates the hosted payment page for `total_amount` and returns it as {'id', 'url'}.
+        `order_id` is None when the order is only saved once the session exists (synchronous checkout).
+        """
+        raise NotImplementedError
+
+    def construct_event(self, payload, signature):
+        """
+        Verifies a webhook request and returns its event ({'id', 'type', 'data': {'object': ...}}).
+        Raises WebhookVerificationError if the payload or its signature is invalid.
+        """
+        raise NotImplementedError
+
+
+class StripeGateway(PaymentGateway):
+    """
+    Stripe Checkout. Calls go through one StripeClient per process whose requests.Session keeps a pool of
+    PAYMENT_GATEWAY_POOL_SIZE connections to the API open, with explicit connect and read timeouts.
+    """
+    def __init__(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.PAYMENT_GATEWAY_POOL_SIZE
+        )
+        session.mount('https://', adapter)
+        http_client = stripe.RequestsClient(
+            timeout=(settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT, settings.PAYMENT_GATEWAY_READ_TIMEOUT),
+            session=session,
+        )
+        self.client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=http_client,
+            max_network_retries=settings.PAYMENT_GATEWAY_MAX_RETRIES,
+        )
+
+    def create_checkout_session(self, order_id, total_amount):
+        params = {
+            'payment_method_types': ['card'],
+            'line_items': [
+                {
+                    'price_data': {
+                        'currency': 'usd',
+                        'product_data': {
+                            'name': 'Total Cart Purchase',
+                        },
+                        'unit_amount': int(total_amount * 100),  # Convert to cents
+                    },
+                    'quantity': 1
+                },
+            ],
+            'mode': 'payment',
+            'success_url': settings.AFTER_PAYMENT_REDIRECT_URL,
+            'cancel_url': settings.AFTER_PAYMENT_REDIRECT_URL,
+            'expires_at': int(time.time()) + settings.CHECKOUT_SESSION_TTL,
+        }
+        if order_id:
+            params['client_reference_id'] = str(order_id)
+        session = self.client.checkout.sessions.create(params=params)
+        return {'id': session.id, 'url': session.url}
+
+    def construct_event(self, payload, signature):
+        try:
+            return self.client.construct_event(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+        except ValueError as e:
+            raise WebhookVerificationError(f"Invalid payload: {str(e)}")
+        except stripe.error.SignatureVerificationError as e:
+            raise WebhookVerificationError(f"Invalid signature: {str(e)}")
+
+
+# (status, payment_status) of the session carried by each checkout.session.* event
+FAKE_SESSION_STATES = {
+    'checkout.session.completed': {'status': 'complete', 'payment_status': 'paid'},
+    'checkout.session.async_payment_succeeded': {'status': 'complete', 'payment_status': 'paid'},
+    'checkout.session.async_payment_failed': {'status': 'complete', 'payment_status': 'unpaid'},
+    'checkout.session.expired': {'status': 'expired', 'payment_status': 'unpaid'},
+}
+
+
+class FakeGateway(PaymentGateway):
+    """
+    In-process stand-in for load tests and offline benchmarks, it never touches the network. Creating a session
+    takes FAKE_GATEWAY_LATENCY seconds (plus up to FAKE_GATEWAY_JITTER) and fails with probability
+    FAKE_GATEWAY_FAILURE_RATE. Webhook payloads are signed with an HMAC of STRIPE_WEBHOOK_SECRET, see
+    `build_event`.
+    """
+    def __init__(self):
+        self.random = random.Random()
+
+    def create_checkout_session(self, order_id, total_amount):
+        time.sleep(settings.FAKE_GATEWAY_LATENCY + self.random.uniform(0, settings.FAKE_GATEWAY_JITTER))
+        if self.random.random() < settings.FAKE_GATEWAY_FAILURE_RATE:
+            raise PaymentGatewayError("Injected gateway failure")
+        session_id = f"cs_fake_{uuid.uuid4().hex}"
+        return {'id': session_id, 'url': f"https://checkout.invalid/pay/{session_id}"}
+
+    def sign(self, payload):
+        secret = (settings.STRIPE_WEBHOOK_SECRET or '').encode()
+        return hmac.new(secret, payload, hashlib.sha256).hexdigest()
+
+    def build_event(self, event_type, session_id, **fields):
+        """
+        Returns (payload, signature) of a webhook request about one of this gateway's sessions, shaped like
+        Stripe's: checkout.session.* events carry the session, payment_intent.* events the session's
+        PaymentIntent (whose id is not the session id). `fields` are set on the object.
+        """
+        payment_intent_id = f"pi_fake_{session_id.removeprefix('cs_fake_')}"
+        if event_type.startswith('checkout.session.'):
+            data_object = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'payment_intent': payment_intent_id,
+                **FAKE_SESSION_STATES.get(event_type, {}),
+            }
+        elif event_type.startswith('payment_intent.'):
+            data_object = {'id': payment_intent_id, 'object': 'payment_intent', 'status': 'requires_payment_method'}
+        else:
+            raise ValueError(f"Unsupported event type: {event_type}")
+        payload = json.dumps({
+            'id': f"evt_fake_{uuid.uuid4().hex}",
+            'object': 'event',
+            'type': event_type,
+            'data': {'object': {**data_object, **fields}},
+        }).encode()
+        return payload, self.sign(payload)
+
+    def construct_event(self, payload, signature):
+        if not hmac.compare_digest(self.sign(payload), signature or ''):
+            raise WebhookVerificationError("Invalid signature")
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise WebhookVerificationError(f"Invalid payload: {str(e)}")
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from order.models import IdempotencyKey
+from mutaengine.utils import custom_response
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _cache_key(user_id, key):
+    return f"idempotency:{user_id}:{hashlib.sha1(key.encode()).hexdigest()}"
+
+
+def _replay(response_status, response_body):
+    return Response(response_body, status=response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def _claim(user, key):
+    """
+    Returns (record, owned). `owned` is True when this request inserted the key (or took over an expired or
+    abandoned one) and must process it; otherwise the record belongs to another request.
+    """
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    locked_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return record, True
+        except IntegrityError:
+            # The (user, key) unique constraint: somebody else holds the key
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue
+        if record.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            continue
+        abandoned_before = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        if record.status == IdempotencyKey.IN_PROGRESS and record.locked_at <= abandoned_before:
+            # Conditional update, so only one of several retries takes over
+            if IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at).update(locked_at=now):
+                logger.warning(f"Taking over abandoned idempotency key {key} of user {user.id}")
+                record.locked_at = now
+                return record, True
+            continue
+        return record, False
+
+
+def run_idempotent(request, action, *args, **kwargs):
+    """
+    Runs `action(request, *args, **kwargs)` at most once per `Idempotency-Key` header value and user.
+
+    The first request with a key stores its response for IDEMPOTENCY_KEY_TTL seconds and retries get that
+    response back (with an `Idempotent-Replayed: true` header) without running the action again. A retry
+    arriving while the first request is still running waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds for it,
+    then gets a 409. Errors (raised exceptions and 5xx responses) are not stored, so the request can be retried.
+    Requests without the header are not affected.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return action(request, *args, **kwargs)
+    if len(key) > 255:
+        raise exceptions.ValidationError({IDEMPOTENCY_HEADER: "Must be at most 255 characters long."})
+
+    cache_key = _cache_key(request.user.id, key)
+    stored = cache.get(cache_key)
+    if stored:
+        logger.info(f"Replaying the response stored for idempotency key {key}")
+        return _replay(*stored)
+
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        record, owned = _claim(request.user, key)
+        if owned:
+            break
+        if record.status == IdempotencyKey.COMPLETED:
+            stored = (record.response_status, record.response_body)
+            cache.set(cache_key, stored, max((record.expires_at - timezone.now()).total_seconds(), 1))
+            logger.info(f"Replaying the response stored for idempotency key {key}")
+            return _replay(*stored)
+        if time.monotonic() >= deadline:
+            logger.info(f"{request.user.username} retried idempotency key {key} while it was still being processed")
+            return custom_response(
+                message="A request with this Idempotency-Key is still being processed.",
+                data={},
+                status_code=status.HTTP_409_CONFLICT
+            )
+        time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+    owner = IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at)
+    try:
+        response = action(request, *args, **kwargs)
+    except Exception:
+        owner.delete()
+        raise
+
+    if response.status_code >= 500:
+        owner.delete()
+    else:
+        owner.update(
+            status=IdempotencyKey.COMPLETED,
+            response_status=response.status_code,
+            response_body=response.data,
+        )
+        cache.set(cache_key, (response.status_code, response.data), settings.IDEMPOTENCY_KEY_TTL)
+    return response
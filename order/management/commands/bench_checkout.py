@@ -0,0 +1,115 @@
+import statistics
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+from cart.models import Cart
+from order.gateways import get_payment_gateway
+from order.models import Order
+from order.webhooks import run_worker
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs checkouts end to end (POST /api/order/, the checkout.session.completed webhook, then processing the "
+        "stored event) against the in-process FakeGateway and reports their latency. No network calls; everything "
+        "is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--items', type=int, default=5, help="Products in each cart.")
+        parser.add_argument('--latency', type=float, default=settings.FAKE_GATEWAY_LATENCY)
+        parser.add_argument('--jitter', type=float, default=settings.FAKE_GATEWAY_JITTER)
+        parser.add_argument('--failure-rate', type=float, default=settings.FAKE_GATEWAY_FAILURE_RATE)
+
+    def seed(self, items):
+        user = User.objects.create_user(username='bench-checkout', email='bench-checkout@example.com')
+        products = Product.objects.bulk_create([
+            Product(
+                title=f"Bench product {index}",
+                price='9.99',
+                description="Benchmark product",
+                image="https://example.com/image.png",
+                category='bench',
+                rating=3,
+            )
+            for index in range(items)
+        ])
+        return user, products
+
+    def summarize(self, name, timings):
+        if not timings:
+            self.stdout.write(f"  {name:<10} no successful requests")
+            return
+        timings.sort()
+        self.stdout.write(
+            f"  {name:<10} median {statistics.median(timings):8.2f}  p95 {timings[int(len(timings) * 0.95) - 1]:8.2f}"
+            f"  max {timings[-1]:8.2f}"
+        )
+
+    def run(self, orders, items):
+        user, products = self.seed(items)
+        client = APIClient()
+        client.force_authenticate(user)
+        gateway = get_payment_gateway()
+        checkout_timings, webhook_timings, processing_timings, failed = [], [], [], 0
+
+        started = time.perf_counter()
+        for _ in range(orders):
+            cart, created = Cart.objects.get_or_create(user=user)
+            for product in products:
+                cart.add_product(product, 1)
+
+            start = time.perf_counter()
+            response = client.post('/api/order/')
+            checkout_timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 201:
+                failed += 1
+                continue
+
+            session_id = Order.objects.values_list('external_order_id', flat=True).get(
+                pk=response.data['data']['order_id']
+            )
+            payload, signature = gateway.build_event('checkout.session.completed', session_id)
+            start = time.perf_counter()
+            response = client.post(
+                '/api/stripe/webhook/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature
+            )
+            webhook_timings.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            run_worker('bench', threading.Event(), drain=True)
+            processing_timings.append((time.perf_counter() - start) * 1000)
+        return checkout_timings, webhook_timings, processing_timings, failed, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        orders = options['orders']
+        fake_gateway = override_settings(
+            PAYMENT_GATEWAY_BACKEND='order.gateways.FakeGateway',
+            FAKE_GATEWAY_LATENCY=options['latency'],
+            FAKE_GATEWAY_JITTER=options['jitter'],
+            FAKE_GATEWAY_FAILURE_RATE=options['failure_rate'],
+            # Synchronous checkout: the async workers would need the orders committed
+            CHECKOUT_MODE='sync',
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+
+        self.stdout.write(
+            f"Running {orders} checkouts of {options['items']} items, gateway latency {options['latency']}s"
+            f" (+{options['jitter']}s jitter), failure rate {options['failure_rate']:.0%}..."
+        )
+        with fake_gateway, transaction.atomic():
+            checkout_timings, webhook_timings, processing_timings, failed, elapsed = self.run(orders, options['items'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{orders} checkouts in {elapsed:.2f}s ({orders / elapsed:.1f}/s), {failed} failed. Latency in ms:")
+        self.summarize("checkout", checkout_timings)
+        self.summarize("webhook", webhook_timings)
+        self.summarize("processing", processing_timings)
@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from order.filters import ORDER_HISTORY_ORDERING
+from order.models import Order
+
+
+# The indexes behind the webhook lookup and the order history
+HOT_LOOKUP_INDEXES = ('order_external_id_unique', 'order_user_created_idx')
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the webhook lookup (by external_order_id) and the order history page (by user, newest first) on a "
+        "seeded orders table, with and without their indexes. PostgreSQL only; everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def seed(self, orders, users, batch_size):
+        user_ids = [
+            user.id for user in User.objects.bulk_create(
+                [User(username=f"bench-orders-{index}") for index in range(users)], batch_size=batch_size
+            )
+        ]
+        for start in range(0, orders, batch_size):
+            Order.objects.bulk_create([
+                Order(
+                    user_id=random.choice(user_ids),
+                    total_amount=index % 500,
+                    status='COMPLETED',
+                    external_order_id=f"cs_bench_{index}",
+                )
+                for index in range(start, min(start + batch_size, orders))
+            ])
+            self.stdout.write(f"  seeded {min(start + batch_size, orders)} orders", ending='\r')
+        self.stdout.write('')
+        return user_ids
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(Order._meta.db_table)}")
+
+    def time_lookups(self, func, arguments):
+        func(arguments[0])
+        timings = []
+        for argument in arguments:
+            start = time.perf_counter()
+            func(argument)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+    def run_lookups(self, session_ids, user_ids):
+        page_size = settings.PAGINATION_DEFAULT_LIMIT
+        return {
+            "webhook lookup": self.time_lookups(
+                lambda session_id: Order.objects.filter(external_order_id=session_id).first(), session_ids
+            ),
+            "history page": self.time_lookups(
+                lambda user_id: list(Order.objects.filter(user_id=user_id).order_by(*ORDER_HISTORY_ORDERING)[:page_size]),
+                user_ids,
+            ),
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The benchmark drops indexes inside a transaction, which needs PostgreSQL.")
+        orders, lookups = options['orders'], options['lookups']
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {orders} orders for {options['users']} users...")
+            user_ids = self.seed(orders, options['users'], options['batch_size'])
+            self.analyze()
+            session_ids = [f"cs_bench_{random.randrange(orders)}" for _ in range(lookups)]
+            sampled_user_ids = [random.choice(user_ids) for _ in range(lookups)]
+
+            indexed = self.run_lookups(session_ids, sampled_user_ids)
+            with connection.schema_editor() as schema_editor:
+                for constraint in Order._meta.constraints:
+                    if constraint.name in HOT_LOOKUP_INDEXES:
+                        schema_editor.remove_constraint(Order, constraint)
+                for index in Order._meta.indexes:
+                    if index.name in HOT_LOOKUP_INDEXES:
+                        schema_editor.remove_index(Order, index)
+            self.analyze()
+            unindexed = self.run_lookups(session_ids, sampled_user_ids)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{lookups} lookups each, median / p95 in ms:")
+        for name in indexed:
+            self.stdout.write(
+                f"  {name:<16} without indexes {unindexed[name][0]:8.2f} / {unindexed[name][1]:8.2f}"
+                f"    with indexes {indexed[name][0]:8.2f} / {indexed[name][1]:8.2f}"
+                f"    {unindexed[name][0] / indexed[name][0]:6.1f}x"
+            )
@@ -0,0 +1,47 @@
+import os
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from order.webhooks import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Processes the stored payment webhook events with a pool of worker threads, until interrupted. "
+        "With --drain, stops once no event is due."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.WEBHOOK_WORKERS)
+        parser.add_argument('--drain', action='store_true', help="Exit once there is no event left to process")
+
+    def work(self, worker_id, stop, drain, handled):
+        try:
+            handled[worker_id] = run_worker(worker_id, stop, drain=drain)
+        finally:
+            # Each thread has its own connection, close it with the thread
+            connection.close()
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        handled = {}
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(target=self.work, args=(f"{prefix}:{index}", stop, options['drain'], handled), daemon=True)
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Processing webhook events with {len(threads)} workers...")
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            # Let the workers finish the event they are on, unfinished ones are retried after the lease timeout
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(f"Processed {sum(handled.values())} webhook events"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from order.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired checkout idempotency keys"
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys"))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from order.checkout import complete_checkout_session
+from order.models import Order
+
+
+class Command(BaseCommand):
+    help = "Creates the gateway session of orders left in PENDING_SESSION, e.g. by a process that died mid-checkout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=60, help="Only orders created this many seconds ago or more")
+
+    def handle(self, *args, **options):
+        created_before = timezone.now() - timedelta(seconds=options['older_than'])
+        order_ids = list(
+            Order.objects.filter(status="PENDING_SESSION", created_at__lte=created_before).values_list('id', flat=True)
+        )
+        for order_id in order_ids:
+            complete_checkout_session(order_id)
+        self.stdout.write(self.style.SUCCESS(f"Resumed {len(order_ids)} checkouts"))
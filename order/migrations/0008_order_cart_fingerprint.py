@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='cart_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'cart_fingerprint'], name='order_user_fingerprint_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_order_cart_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('external_order_id',), name='order_external_id_unique'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_order_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='external_order_id',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending_session', 'Pending session'), ('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0011_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='session_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
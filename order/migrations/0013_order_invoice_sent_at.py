@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_invoice_sent_at(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    # Completed orders got their invoice inside the webhook request, don't send it again on a redelivery
+    Order.objects.filter(status='COMPLETED').update(invoice_sent_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0012_order_session_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_invoice_sent_at, migrations.RunPython.noop),
+    ]
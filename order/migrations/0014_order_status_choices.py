@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-17 23:04
+
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+
+def upper_case_statuses(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    # Orders saved with the old lower-case default, everything else was already written upper-cased
+    Order.objects.filter(status__in=['pending', 'completed', 'failed']).update(status=Upper('status'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0013_order_invoice_sent_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('PENDING_SESSION', 'Pending session'), ('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+        migrations.RunPython(upper_case_statuses, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,55 @@
+import hashlib
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
-        ('pending', 'Pending'),
-        ('completed', 'Completed'),
-        ('failed', 'Failed'),
+        ('PENDING_SESSION', 'Pending session'),
+        ('PENDING', 'Pending'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES, default='pending')
-    external_order_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default='PENDING')
+    # Empty while an asynchronous checkout is still creating the gateway session
+    external_order_id = models.CharField(max_length=255, null=True)
     payment_url = models.CharField(max_length=2000, null=True)
+    # Set while a checkout worker is creating the gateway session of a PENDING_SESSION order, see
+    # order.checkout.complete_checkout_session
+    session_claimed_at = models.DateTimeField(null=True, blank=True)
+    # Set once the invoice email of a completed order went out, so a retried webhook only sends a missing one
+    invoice_sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Hash of the cart lines the order was created from, see Order.get_cart_fingerprint
+    cart_fingerprint = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            # Webhooks look orders up by their checkout session id
+            models.UniqueConstraint(fields=['external_order_id'], name='order_external_id_unique'),
+        ]
+        indexes = [
+            # Order history: a user's orders, newest first (see order.filters.ORDER_HISTORY_ORDERING)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'cart_fingerprint'], name='order_user_fingerprint_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
+    @staticmethod
+    def get_cart_fingerprint(cart_items):
+        """
+        Hash of the (product, quantity, unit price) lines of a cart, independent of the order of the items.
+        """
+        lines = sorted((item.product_id, item.quantity, str(item.price)) for item in cart_items)
+        return hashlib.sha256(repr(lines).encode()).hexdigest()
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey('product.Product', on_delete=models.CASCADE)
@@ -29,3 +60,78 @@ class OrderItem(models.Model):
     @property
     def total_price(self):
         return self.product.price * self.quantity
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an `Idempotency-Key` header, replayed to retries of it (see order.idempotency).
+    """
+    IN_PROGRESS = 'in_progress'
+    COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    # When the request currently processing the key started, to detect one that died
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} for user {self.user_id}"
+
+
+class WebhookEvent(models.Model):
+    """
+    A verified payment gateway webhook event, stored by the webhook view and processed by
+    `manage.py process_webhooks` (see order.webhooks).
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    ]
+
+    # The gateway's event id, retried deliveries of an event are stored once
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    # Id of the object the event is about (the checkout session), its events are processed in arrival order
+    object_id = models.CharField(max_length=255, blank=True, default='')
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # The worker processing the event and since when, to take over events of a worker that died
+    locked_by = models.CharField(max_length=255, blank=True, default='')
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_event_due_idx'),
+            models.Index(fields=['object_id', 'id'], name='webhook_event_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"Webhook event {self.event_id} ({self.type})"
@@ -1,3 +1,594 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from cart.models import Cart
+from order.checkout import checkout_status_key, complete_checkout_session
+from order.gateways import get_payment_gateway
+from order.models import IdempotencyKey, Order, OrderItem, WebhookEvent
+from order.webhooks import claim_event, process_event, run_worker
+from product.models import Product
 
-# Create your tests here.
+
+class OrderCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price='2.50',
+                description="Description",
+                image="https://example.com/image.png",
+                category='misc',
+                rating=3,
+            )
+            for index in range(10)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.session = mock.patch(
+            'order.views.create_checkout_session',
+            return_value={'id': 'cs_test', 'url': 'https://checkout.example.com/cs_test'},
+        )
+        self.session.start()
+        self.addCleanup(self.session.stop)
+
+    def place_order(self, item_count):
+        Order.objects.all().delete()
+        cart, created = Cart.objects.get_or_create(user=self.user)
+        cart.clear()
+        for product in self.products[:item_count]:
+            cart.add_product(product, 2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/order/')
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.assertEqual(self.place_order(1), self.place_order(10))
+
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 50)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 10)
+
+    def test_order_is_not_written_without_its_items(self):
+        Cart.objects.create(user=self.user).add_product(self.products[0], 1)
+
+        with mock.patch('order.views.OrderItem.objects.bulk_create', side_effect=RuntimeError("boom")):
+            response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderIdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        Cart.objects.create(user=self.user).add_product(self.product, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        session = mock.patch(
+            'order.views.create_checkout_session',
+            return_value={'id': 'cs_test', 'url': 'https://checkout.example.com/cs_test'},
+        )
+        self.create_session = session.start()
+        self.addCleanup(session.stop)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        cache.clear()
+        retry = self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.create_session.call_count, 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_cached_replay_does_not_touch_the_database(self):
+        self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        with self.assertNumQueries(0):
+            retry = self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 201)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_key_in_progress_conflicts(self):
+        now = timezone.now()
+        IdempotencyKey.objects.create(user=self.user, key='checkout-1', locked_at=now, expires_at=now + timedelta(days=1))
+
+        response = self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(self.create_session.called)
+
+    def test_failed_request_can_be_retried(self):
+        self.create_session.side_effect = RuntimeError("Stripe is down")
+        self.assertEqual(self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1').status_code, 500)
+
+        self.create_session.side_effect = None
+        self.assertEqual(self.client.post('/api/order/', HTTP_IDEMPOTENCY_KEY='checkout-1').status_code, 201)
+
+
+class OrderSessionReuseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price='2.50',
+                description="Description",
+                image="https://example.com/image.png",
+                category='misc',
+                rating=3,
+            )
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+        self.cart.add_product(self.products[0], 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        session = mock.patch(
+            'order.views.create_checkout_session',
+            side_effect=lambda *args: {'id': f"cs_{mock_session.call_count}", 'url': f"https://pay/{mock_session.call_count}"},
+        )
+        mock_session = self.create_session = session.start()
+        self.addCleanup(session.stop)
+
+    def test_unchanged_cart_reuses_the_pending_session(self):
+        first = self.client.post('/api/order/')
+        again = self.client.post('/api/order/')
+
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['data'], first.data['data'])
+        self.assertEqual(self.create_session.call_count, 1)
+
+    def test_changed_cart_gets_a_new_session(self):
+        self.client.post('/api/order/')
+        self.cart.add_product(self.products[1], 1)
+
+        response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.create_session.call_count, 2)
+
+    @override_settings(PAYMENT_GATEWAY_BACKEND='order.gateways.FakeGateway', STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_session_paid_but_not_processed_yet_is_not_reused(self):
+        self.client.post('/api/order/')
+        # Back from the success URL before the webhook workers got to the completion
+        session_id = Order.objects.get().external_order_id
+        payload, signature = get_payment_gateway().build_event('checkout.session.completed', session_id)
+        self.client.post('/api/stripe/webhook/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+        self.assertEqual(Order.objects.get().status, 'PENDING')
+
+        response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.create_session.call_count, 2)
+
+    def test_expiring_session_is_not_reused(self):
+        self.client.post('/api/order/')
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(self.client.post('/api/order/').status_code, 201)
+        self.assertEqual(self.create_session.call_count, 2)
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_orders(self, count, status='PENDING', items=3):
+        orders = []
+        for index in range(count):
+            order = Order.objects.create(user=self.user, total_amount=5, external_order_id=f"cs_{status}_{index}", status=status)
+            OrderItem.objects.bulk_create(
+                [OrderItem(order=order, product=self.product, quantity=2, price=5) for _ in range(items)]
+            )
+            orders.append(order)
+        return orders
+
+    def test_query_count_does_not_depend_on_orders_or_items(self):
+        for count, items in ((1, 1), (10, 5)):
+            with self.subTest(orders=count, items=items):
+                Order.objects.all().delete()
+                self.create_orders(count, items=items)
+
+                # The page of orders + their items joined with their products
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/order/')
+
+                self.assertEqual(len(response.data['data']['results']), count)
+                self.assertEqual(len(response.data['data']['results'][0]['items']), items)
+
+    def test_pages_newest_first(self):
+        orders = self.create_orders(5)
+
+        first = self.client.get('/api/order/', {'limit': 3})
+        second = self.client.get('/api/order/', {'limit': 3, 'cursor': first.data['data']['next_cursor']})
+
+        ids = [order['id'] for order in first.data['data']['results'] + second.data['data']['results']]
+        self.assertEqual(ids, [order.id for order in reversed(orders)])
+        self.assertIsNone(second.data['data']['next_cursor'])
+
+    def test_filters_by_status_and_date(self):
+        pending = self.create_orders(1)[0]
+        completed = self.create_orders(1, status='COMPLETED')[0]
+        Order.objects.filter(pk=completed.pk).update(created_at=timezone.now() - timedelta(days=10))
+
+        response = self.client.get('/api/order/', {'status': 'completed'})
+        self.assertEqual([order['id'] for order in response.data['data']['results']], [completed.id])
+
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get('/api/order/', {'created_after': since})
+        self.assertEqual([order['id'] for order in response.data['data']['results']], [pending.id])
+
+        self.assertEqual(self.client.get('/api/order/', {'status': 'shipped'}).status_code, 400)
+
+
+@override_settings(CHECKOUT_MODE='async', CHECKOUT_WORKERS=0)
+class AsyncCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        Cart.objects.create(user=self.user).add_product(self.product, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        gateway = mock.patch(
+            'order.checkout.create_checkout_session',
+            return_value={'id': 'cs_async', 'url': 'https://checkout.example.com/cs_async'},
+        )
+        self.create_session = gateway.start()
+        self.addCleanup(gateway.stop)
+
+    def test_order_is_accepted_before_the_session_exists(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['data']['status'], 'PENDING_SESSION')
+        self.assertIsNone(response.data['data']['checkout_url'])
+        self.assertFalse(self.create_session.called)
+        self.assertEqual(Order.objects.get().get_status_display(), 'Pending session')
+
+        # What the checkout worker runs once the order is committed
+        for callback in callbacks:
+            callback()
+        order_id = response.data['data']['order_id']
+        self.create_session.assert_called_once_with(order_id, Decimal('5.00'))
+
+        response = self.client.get(f'/api/order/{order_id}/status/', {'wait': 1})
+        self.assertEqual(response.data['data'], {
+            'order_id': order_id, 'status': 'PENDING', 'checkout_url': 'https://checkout.example.com/cs_async',
+        })
+        self.assertEqual(Order.objects.get().external_order_id, 'cs_async')
+
+    def test_gateway_failure_fails_the_order(self):
+        self.create_session.side_effect = RuntimeError("Gateway timeout")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/order/')
+
+        status = self.client.get(f"/api/order/{response.data['data']['order_id']}/status/")
+        self.assertEqual(status.data['data']['status'], 'FAILED')
+
+    def test_status_of_another_users_order_is_not_found(self):
+        other = User.objects.create_user(username='other', password='Secret@123')
+        order = Order.objects.create(user=other, total_amount=5, status='PENDING_SESSION')
+
+        self.assertEqual(self.client.get(f'/api/order/{order.id}/status/').status_code, 404)
+
+    def create_pending_order(self):
+        return Order.objects.create(user=self.user, total_amount=5, status='PENDING_SESSION')
+
+    @override_settings(CHECKOUT_STATUS_POLL_INTERVAL=0.01)
+    def test_long_poll_falls_back_to_the_database(self):
+        order = self.create_pending_order()
+
+        def sleep(seconds):
+            # A worker of another process created the session and published it to its own cache
+            Order.objects.filter(pk=order.pk).update(status='PENDING', payment_url='https://pay/other')
+        with mock.patch('order.checkout.time.sleep', side_effect=sleep):
+            response = self.client.get(f'/api/order/{order.id}/status/', {'wait': 0.05})
+
+        self.assertEqual(response.data['data'], {
+            'order_id': order.id, 'status': 'PENDING', 'checkout_url': 'https://pay/other',
+        })
+
+    def test_claimed_order_is_left_to_its_worker(self):
+        order = self.create_pending_order()
+
+        def create_session(order_id, total_amount):
+            # A second completion (e.g. resume_checkout_sessions) while the gateway call is in flight
+            complete_checkout_session(order_id)
+            return {'id': 'cs_first', 'url': 'https://pay/first'}
+        self.create_session.side_effect = create_session
+
+        complete_checkout_session(order.id)
+
+        self.assertEqual(self.create_session.call_count, 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.external_order_id), ('PENDING', 'cs_first'))
+
+    def test_worker_that_lost_its_lease_publishes_what_was_written(self):
+        order = self.create_pending_order()
+        sessions = iter([{'id': 'cs_second', 'url': 'https://pay/second'}])
+
+        def create_session(order_id, total_amount):
+            if self.create_session.call_count > 1:
+                return next(sessions)
+            # The first worker stalls past its lease and another one takes the order over and finishes it
+            Order.objects.filter(pk=order_id).update(session_claimed_at=timezone.now() - timedelta(minutes=5))
+            complete_checkout_session(order_id)
+            return {'id': 'cs_first', 'url': 'https://pay/first'}
+        self.create_session.side_effect = create_session
+
+        complete_checkout_session(order.id)
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.external_order_id), ('PENDING', 'cs_second'))
+        # What long-polling clients are handed
+        self.assertEqual(cache.get(checkout_status_key(order.id))[1]['checkout_url'], 'https://pay/second')
+
+
+@override_settings(CHECKOUT_MODE='async', CHECKOUT_WORKERS=0)
+class ConcurrentCheckoutSessionTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("In-memory SQLite reports 'table is locked' instead of waiting for concurrent writers")
+        cache.clear()
+        user = User.objects.create_user(username='buyer', password='Secret@123')
+        self.order = Order.objects.create(user=user, total_amount=5, status='PENDING_SESSION')
+
+    def test_concurrent_completions_create_one_session(self):
+        barrier = threading.Barrier(2)
+
+        def create_session(order_id, total_amount):
+            time.sleep(0.2)
+            return {'id': f"cs_{threading.get_ident()}", 'url': f"https://pay/{threading.get_ident()}"}
+
+        def worker():
+            try:
+                barrier.wait()
+                complete_checkout_session(self.order.id)
+            finally:
+                connection.close()
+
+        with mock.patch('order.checkout.create_checkout_session', side_effect=create_session) as create_session_mock:
+            workers = [threading.Thread(target=worker) for _ in range(2)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+
+        self.assertEqual(create_session_mock.call_count, 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PENDING')
+        self.assertEqual(cache.get(checkout_status_key(self.order.id))[1]['checkout_url'], self.order.payment_url)
+
+
+@override_settings(
+    PAYMENT_GATEWAY_BACKEND='order.gateways.FakeGateway',
+    FAKE_GATEWAY_LATENCY=0,
+    FAKE_GATEWAY_JITTER=0,
+    FAKE_GATEWAY_FAILURE_RATE=0,
+    STRIPE_WEBHOOK_SECRET='whsec_test',
+)
+class FakeGatewayCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Widget",
+            price='2.50',
+            description="Description",
+            image="https://example.com/image.png",
+            category='misc',
+            rating=3,
+        )
+
+    def setUp(self):
+        Cart.objects.create(user=self.user).add_product(self.product, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_webhook(self, payload, signature):
+        return self.client.post(
+            '/api/stripe/webhook/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature
+        )
+
+    def test_checkout_and_webhook_run_offline(self):
+        response = self.client.post('/api/order/')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertTrue(order.external_order_id.startswith('cs_fake_'))
+        self.assertEqual(response.data['data']['checkout_url'], order.payment_url)
+
+        payload, signature = get_payment_gateway().build_event('checkout.session.completed', order.external_order_id)
+        response = self.post_webhook(payload, signature)
+        self.assertEqual(response.status_code, 200)
+        with mock.patch('order.webhooks.send_invoice_email') as send_invoice_email:
+            run_worker('test', threading.Event(), drain=True)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'COMPLETED')
+        send_invoice_email.assert_called_once()
+        self.assertFalse(Cart.objects.get(user=self.user).items.exists())
+
+    def test_webhook_with_a_bad_signature_is_rejected(self):
+        payload, signature = get_payment_gateway().build_event('checkout.session.completed', 'cs_fake_unknown')
+
+        self.assertEqual(self.post_webhook(payload, 'forged').status_code, 400)
+        self.assertEqual(self.post_webhook(payload + b' ', signature).status_code, 400)
+
+    @override_settings(FAKE_GATEWAY_FAILURE_RATE=1)
+    def test_injected_gateway_failure(self):
+        response = self.client.post('/api/order/')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(
+    PAYMENT_GATEWAY_BACKEND='order.gateways.FakeGateway',
+    STRIPE_WEBHOOK_SECRET='whsec_test',
+    WEBHOOK_MAX_ATTEMPTS=2,
+    WEBHOOK_LEASE_TIMEOUT=60,
+)
+class WebhookInboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='Secret@123', email='buyer@example.com')
+        cls.order = Order.objects.create(user=cls.user, total_amount=5, status='PENDING', external_order_id='cs_1')
+
+    def deliver(self, event_type, session_id='cs_1', **fields):
+        payload, signature = get_payment_gateway().build_event(event_type, session_id, **fields)
+        response = self.client.post(
+            '/api/stripe/webhook/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature
+        )
+        self.assertEqual(response.status_code, 200)
+        return payload, signature
+
+    def process_all(self):
+        with mock.patch('order.webhooks.send_invoice_email') as send_invoice_email:
+            run_worker('test', threading.Event(), drain=True)
+        self.order.refresh_from_db()
+        return send_invoice_email
+
+    def test_events_are_stored_once_and_processed_later(self):
+        payload, signature = self.deliver('checkout.session.completed')
+        self.client.post('/api/stripe/webhook/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.object_id), (WebhookEvent.PENDING, 'cs_1'))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PENDING')
+
+        send_invoice_email = self.process_all()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.PROCESSED, 1))
+        self.assertEqual(self.order.status, 'COMPLETED')
+        self.assertIsNotNone(self.order.invoice_sent_at)
+        send_invoice_email.assert_called_once()
+
+    def test_only_the_failed_invoice_is_retried(self):
+        self.deliver('checkout.session.completed')
+
+        with mock.patch('order.webhooks.send_invoice_email', side_effect=RuntimeError("SMTP down")):
+            process_event(claim_event('test'))
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.last_error), (WebhookEvent.PENDING, 1, "SMTP down"))
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        # The order is completed (and its cart cleared) without waiting for the email
+        order = Order.objects.get()
+        self.assertEqual((order.status, order.invoice_sent_at), ('COMPLETED', None))
+        self.assertIsNone(claim_event('test'))
+
+        WebhookEvent.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('order.webhooks.get_cart_storage') as get_cart_storage:
+            send_invoice_email = self.process_all()
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.PROCESSED)
+        send_invoice_email.assert_called_once()
+        get_cart_storage.assert_not_called()
+
+    def test_event_is_given_up_after_the_last_attempt(self):
+        self.deliver('checkout.session.completed')
+
+        with mock.patch('order.webhooks.send_invoice_email', side_effect=RuntimeError("SMTP down")):
+            process_event(claim_event('test'))
+            WebhookEvent.objects.update(next_attempt_at=timezone.now())
+            process_event(claim_event('test'))
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.FAILED)
+
+    def test_only_paid_sessions_complete_the_order(self):
+        # A declined card: the customer can retry on the same session, and the PaymentIntent isn't the order's id
+        self.deliver('payment_intent.payment_failed')
+        # A delayed payment method completes the session before it is paid
+        self.deliver('checkout.session.completed', payment_status='unpaid')
+        self.process_all()
+        self.assertEqual(self.order.status, 'PENDING')
+
+        self.deliver('checkout.session.async_payment_succeeded')
+        self.process_all()
+        self.assertEqual(self.order.status, 'COMPLETED')
+
+    def test_late_failure_does_not_undo_a_completed_order(self):
+        self.deliver('checkout.session.completed')
+        self.deliver('checkout.session.expired')
+
+        self.process_all()
+
+        self.assertEqual(self.order.status, 'COMPLETED')
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.PROCESSED).count(), 2)
+
+    def test_events_of_an_order_are_processed_in_arrival_order(self):
+        self.deliver('checkout.session.async_payment_failed')
+        self.deliver('checkout.session.completed')
+        self.deliver('checkout.session.completed', session_id='cs_other')
+        first, second, other = WebhookEvent.objects.order_by('id')
+        WebhookEvent.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+
+        # The second event waits for the first, events of other orders don't
+        self.assertEqual(claim_event('test').pk, other.pk)
+        self.assertIsNone(claim_event('test'))
+
+    def test_stale_lease_is_taken_over(self):
+        self.deliver('checkout.session.expired')
+        claimed = claim_event('dead-worker')
+        self.assertIsNone(claim_event('test'))
+
+        WebhookEvent.objects.update(locked_at=timezone.now() - timedelta(minutes=2))
+        event = claim_event('test')
+        self.assertEqual((event.pk, event.locked_by, event.attempts), (claimed.pk, 'test', 2))
+        self.assertTrue(process_event(event))
+        self.assertEqual(Order.objects.get().status, 'FAILED')
@@ -1,9 +1,10 @@
-from order.views import OrderView, StripeWebhookView
+from order.views import OrderStatusView, OrderView, StripeWebhookView
 from django.urls import path
 
 app_name = 'order'
 
 urlpatterns = [
     path('order/', OrderView.as_view(), name='place_order'),
+    path('order/<int:id>/status/', OrderStatusView.as_view(), name='order_status'),
     path('stripe/webhook/', StripeWebhookView.as_view(), name='stripe-webhook'),
 ]
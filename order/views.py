@@ -1,27 +1,73 @@
-import stripe
+import json
 import logging
+from datetime import timedelta
+from decimal import Decimal
 from cart.models import Cart
-from order.models import Order, OrderItem
+from cart.storage import get_cart_storage
+from order.checkout import (
+    create_checkout_session, get_checkout_status, submit_checkout_session, wait_for_checkout_status
+)
+from order.filters import ORDER_HISTORY_ORDERING, filter_orders
+from order.gateways import WebhookVerificationError, get_payment_gateway
+from order.idempotency import run_idempotent
+from order.models import Order, OrderItem, WebhookEvent
 from order.serializers import OrderSerializer
+from order.webhooks import store_event
 from mutaengine.base_view import BaseAPIView
-from mutaengine.utils import custom_response, send_invoice_email
+from mutaengine.pagination import CursorPaginator
+from mutaengine.utils import custom_response
 from django.http import JsonResponse
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework import exceptions, permissions, status
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
-
 class OrderView(BaseAPIView):
     logger = logging.getLogger(__name__)
     permission_classes = [permissions.IsAuthenticated]
 
+    def save_order(self, request, cart_items, total_amount, fingerprint, **fields):
+        # Create the Order and all of its items in your database, together or not at all
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=request.user,
+                total_amount=total_amount,
+                cart_fingerprint=fingerprint,
+                **fields
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    quantity=item.quantity,
+                    price=item.total_price,
+                )
+                for item in cart_items
+            ])
+        self.logger.info(f"Order created successfully with ID: {order.id} and {len(cart_items)} items")
+        return order
+
+    def get_order_response(self, order, message, status_code):
+        return custom_response(
+            message=message,
+            data={
+                "checkout_url": order.payment_url,
+                "order_id": order.id,
+                "status": order.status,
+            },
+            status_code=status_code
+        )
+
     def create_order(self, request, *args, **kwargs):
         self.logger.info(f"{request.user.username} is attempting to create an order.")
 
+        # Write a cart kept in the cache to the database before reading it
+        get_cart_storage(request.user).flush()
+
         # Get cart items for the user
         cart = Cart.objects.filter(user=request.user).first()
         
@@ -29,9 +75,10 @@ class OrderView(BaseAPIView):
             self.logger.info(f"{request.user.username} tried to order with unknown cart")
             raise exceptions.NotFound("Cart Not Found")
         
-        cart_items = cart.items.all()
+        # Read once, with their products: the order lines and the total all come from this one snapshot
+        cart_items = list(cart.items.select_related('product').order_by('id'))
         
-        if not cart_items.exists():
+        if not cart_items:
             self.logger.info(f"{request.user.username} tried to order with empty cart")
             return custom_response(
                 message="Your cart is empty.",
@@ -39,65 +86,53 @@ class OrderView(BaseAPIView):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        # Calculate total amount from cart
-        total_amount = sum(item.total_price for item in cart_items)
+        # From the snapshot rather than cart.subtotal, so the order total always matches its lines
+        total_amount = sum((item.total_price for item in cart_items), Decimal('0.00'))
         self.logger.info(f"Total amount calculated for {request.user.username}'s order: ${total_amount:.2f}")
 
+        # Coming back from the payment page with the same cart: hand out the session that is still open
+        fingerprint = Order.get_cart_fingerprint(cart_items)
+        reusable_after = timezone.now() - timedelta(
+            seconds=settings.CHECKOUT_SESSION_TTL - settings.CHECKOUT_SESSION_REUSE_MARGIN
+        )
+        # The inbox may still hold the session's completion (or expiry) for the webhook workers: whatever the
+        # event, the session is no longer open
+        session_ended = WebhookEvent.objects.filter(
+            object_id=OuterRef('external_order_id'), type__startswith='checkout.session.'
+        )
+        pending_order = Order.objects.filter(
+            user=request.user,
+            status__in=["PENDING", "PENDING_SESSION"],
+            cart_fingerprint=fingerprint,
+            created_at__gt=reusable_after,
+        ).exclude(Exists(session_ended)).order_by('-created_at').first()
+        if pending_order:
+            self.logger.info(f"Reusing the checkout session of pending Order#{pending_order.id}")
+            return self.get_order_response(pending_order, "Pending order reused.", status.HTTP_200_OK)
+
+        if settings.CHECKOUT_MODE == 'async':
+            # The order is written right away and the checkout workers create its gateway session
+            order = self.save_order(request, cart_items, total_amount, fingerprint, status="PENDING_SESSION")
+            submit_checkout_session(order.id)
+            self.logger.info(f"Checkout session of Order#{order.id} queued")
+            return self.get_order_response(order, "Order created, the checkout session is being prepared.", status.HTTP_202_ACCEPTED)
+
         try:
-            # Create a Stripe PaymentIntent
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[
-                    {
-                        'price_data': {
-                            'currency': 'usd',
-                            'product_data': {
-                                'name': 'Total Cart Purchase',
-                            },
-                            'unit_amount': int(total_amount * 100),  # Convert to cents
-                        },
-                        'quantity': 1
-                    },
-                ],
-                mode='payment',
-                success_url=settings.AFTER_PAYMENT_REDIRECT_URL,
-                cancel_url=settings.AFTER_PAYMENT_REDIRECT_URL,
-            )
-            self.logger.info(f"Stripe PaymentIntent created successfully")
+            session = create_checkout_session(None, total_amount)
+            self.logger.info(f"Checkout session created successfully")
 
-            # Create the Order in your database
-            order = Order.objects.create(
-                user=request.user,
-                external_order_id=session['id'],
-                total_amount=total_amount,
-                payment_url=session['url'],
-                status="PENDING"
+            order = self.save_order(
+                request, cart_items, total_amount, fingerprint,
+                status="PENDING", external_order_id=session['id'], payment_url=session['url'],
             )
-            self.logger.info(f"Order created successfully with ID: {order.id}")
-            
-            for item in cart_items:
-                OrderItem.objects.create(
-                   order=order,
-                   product=item.product,
-                   quantity=item.quantity,
-                   price=item.total_price,
-                )
-                self.logger.debug(f"Added item to order: {item.product.title}, Quantity: {item.quantity}")
 
             # cart_items.delete()
 
-            return custom_response(
-                message="Order created successfully.",
-                data={
-                    "checkout_url": session['url'],
-                    "order_id": order.id
-                },
-                status_code=status.HTTP_201_CREATED
-            )
+            return self.get_order_response(order, "Order created successfully.", status.HTTP_201_CREATED)
         except Exception as e:
             self.logger.error(f"500 Error: {str(e)}")
             return custom_response(
-                message="Failed to create Stripe payment intent.",
+                message="Failed to create the checkout session.",
                 data={"error": str(e)},
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
@@ -105,11 +140,18 @@ class OrderView(BaseAPIView):
     # Get all user orders
     def get_user_orders(self, request):
         self.logger.info(f"{request.user.username} is fetching their orders.")
-        orders = Order.objects.filter(user=request.user)
-        serializer = OrderSerializer(orders, many=True)
+        paginator = CursorPaginator(ordering=ORDER_HISTORY_ORDERING)
+        # The page of orders, then all of their items joined with their products: two queries per page
+        orders = filter_orders(Order.objects.filter(user=request.user), request.query_params).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+        )
+        orders, next_cursor = paginator.paginate(request, orders)
         return custom_response(
             message="Orders fetched successfully.",
-            data=serializer.data,
+            data={
+                "results": OrderSerializer(orders, many=True).data,
+                "next_cursor": next_cursor,
+            },
             status_code=status.HTTP_200_OK
         )
 
@@ -118,7 +160,45 @@ class OrderView(BaseAPIView):
         return self.handle_request(request, self.get_user_orders)
 
     def post(self, request, *args, **kwargs):
-        return self.handle_request(request, self.create_order)
+        # Retries sent with the same Idempotency-Key get the first response back instead of a second order
+        return self.handle_request(request, run_idempotent, self.create_order)
+
+
+class OrderStatusView(BaseAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_wait(self, request):
+        try:
+            wait = float(request.query_params.get('wait') or 0)
+        except ValueError:
+            raise exceptions.ValidationError({"wait": "Must be a number of seconds."})
+        return min(max(wait, 0), settings.CHECKOUT_STATUS_MAX_WAIT)
+
+    def get_status(self, request, id):
+        wait = self.get_wait(request)
+        order = Order.objects.filter(pk=id, user=request.user).only('id', 'status', 'payment_url').first()
+        if not order:
+            raise exceptions.NotFound("Order Not Found")
+
+        data = get_checkout_status(order)
+        if order.status == "PENDING_SESSION" and wait:
+            # Long poll: the checkout worker publishes the outcome to the cache, so waiting costs no queries
+            published = wait_for_checkout_status(order.id, wait)
+            if published and published[1]["status"] != "PENDING_SESSION":
+                data = published[1]
+            else:
+                # Nothing published where this process can see it (e.g. a per-process cache), the database
+                # has the outcome if the worker got that far
+                order.refresh_from_db(fields=['status', 'payment_url'])
+                data = get_checkout_status(order)
+        return custom_response(
+            message="Order status fetched successfully.",
+            data=data,
+            status_code=status.HTTP_200_OK
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.get_status, *args, **kwargs)
 
 
 class StripeWebhookView(BaseAPIView):
@@ -128,50 +208,18 @@ class StripeWebhookView(BaseAPIView):
     @method_decorator(csrf_exempt)
     def post(self, request, *args, **kwargs):
         payload = request.body
-        sig_header = request.META['HTTP_STRIPE_SIGNATURE']
-        endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
+        sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
 
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, endpoint_secret
-            )
-            self.logger.info('Webhook received: %s', event)
-        except ValueError as e:
-            # Invalid payload
-            self.logger.error('Invalid payload: %s', str(e))
+            event = get_payment_gateway().construct_event(payload, sig_header)
+            self.logger.info('Webhook received: %s %s', event['id'], event['type'])
+        except WebhookVerificationError as e:
+            # Invalid payload or signature
+            self.logger.error('Invalid webhook: %s', str(e))
             return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except stripe.error.SignatureVerificationError as e:
-            # Invalid signature
-            self.logger.error('Invalid signature: %s', str(e))  # Log error for invalid signature
-            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Handle the event
-        session = event['data']['object']
-        order = Order.objects.filter(external_order_id=session['id']).first()
-
-        if event['type'] == 'checkout.session.completed':
-            # Find the order based on the Stripe Checkout Session ID
-            cart = Cart.objects.filter(user=order.user).first()
-
-            if order:
-                # Mark the order as completed
-                order.status = 'COMPLETED'
-
-                cart.items.all().delete()     # Clear Cart
-                self.logger.info(f"Cart for user({order.user.username}) has been cleared")
-                
-                # Send Invoice Email
-                send_invoice_email(order.user, order)
-                order.save()
-                self.logger.info(f"Order status for Order#{order.id} has been changed to Completed.")
-        
-        elif event['type'] == 'payment_intent.payment_failed':
-            # Find the order based on the Stripe Checkout Session ID
-            if order:
-                # Mark the order as completed
-                order.status = 'FAILED'
-                order.save()
-                self.logger.info(f"Order status for Order#{order.id} has been changed to Failed.")
-                self.logger.info('Order marked as failed: %s', order.id)
+
+        # Acknowledge as soon as the event is stored, `manage.py process_webhooks` handles it (see order.webhooks)
+        if not store_event(json.loads(payload)):
+            self.logger.info('Webhook event %s was already received', event['id'])
 
         return JsonResponse({'status': 'success'}, status=status.HTTP_200_OK)
@@ -0,0 +1,187 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from cart.storage import get_cart_storage
+from order.models import Order, WebhookEvent
+from mutaengine.utils import send_invoice_email
+
+
+logger = logging.getLogger(__name__)
+
+
+def store_event(event):
+    """
+    Writes a verified webhook event (the decoded request body) to the inbox. Returns False if it was already
+    there, i.e. for a retried delivery.
+    """
+    data = event.get('data') or {}
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(
+                event_id=event['id'],
+                type=event['type'],
+                object_id=(data.get('object') or {}).get('id') or '',
+                payload=event,
+            )
+    except IntegrityError:
+        # The unique event_id: the first delivery wins
+        return False
+    return True
+
+
+def send_order_invoice(order):
+    """
+    Sends the invoice email of a completed order unless it was already sent. Runs outside of any transaction,
+    so the order row isn't held while the PDF is rendered and the email sent. If it fails, the webhook event is
+    retried and only the invoice is sent again.
+    """
+    if Order.objects.filter(pk=order.pk, invoice_sent_at__isnull=False).exists():
+        return
+    send_invoice_email(order.user, order)
+    Order.objects.filter(pk=order.pk).update(invoice_sent_at=timezone.now())
+
+
+def complete_order(order, session=None):
+    # Conditional update, so a redelivered or reprocessed event doesn't clear the cart again
+    with transaction.atomic():
+        if Order.objects.filter(pk=order.pk).exclude(status="COMPLETED").update(status="COMPLETED"):
+            get_cart_storage(order.user).clear()     # Clear Cart
+            logger.info(f"Cart for user({order.user.username}) has been cleared")
+            logger.info(f"Order status for Order#{order.id} has been changed to Completed.")
+    order.status = "COMPLETED"
+    send_order_invoice(order)
+
+
+def fail_order(order, session=None):
+    # A late failure event must not undo a completed payment
+    if Order.objects.filter(pk=order.pk).exclude(status="COMPLETED").update(status="FAILED"):
+        order.status = "FAILED"
+        logger.info(f"Order status for Order#{order.id} has been changed to Failed.")
+
+
+def complete_paid_order(order, session):
+    # Delayed payment methods complete the session unpaid, their outcome comes with an async_payment_* event
+    if session.get('payment_status') in ('paid', 'no_payment_required'):
+        complete_order(order)
+
+
+# Checkout Session events, whose object is the session and so carries the id stored on the order. Failed card
+# attempts (payment_intent.payment_failed) are not handled: the customer can retry on the same session, and a
+# session that is never paid ends with checkout.session.expired.
+EVENT_HANDLERS = {
+    'checkout.session.completed': complete_paid_order,
+    'checkout.session.async_payment_succeeded': complete_order,
+    'checkout.session.async_payment_failed': fail_order,
+    'checkout.session.expired': fail_order,
+}
+
+
+def handle_event(event):
+    handler = EVENT_HANDLERS.get(event['type'])
+    if handler is None:
+        return
+    session = event['data']['object']
+    # Find the order based on the Checkout Session ID
+    order = Order.objects.select_related('user').filter(external_order_id=session['id']).first()
+    if not order:
+        logger.warning(f"No order found for webhook event {event['id']} ({event['type']})")
+        return
+    handler(order, session)
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff with jitter: about WEBHOOK_RETRY_BASE_DELAY * 2^(attempts - 1) seconds,
+    capped at WEBHOOK_RETRY_MAX_DELAY.
+    """
+    delay = min(settings.WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.WEBHOOK_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_event(worker_id):
+    """
+    Takes the oldest event that is due, or whose worker has held it for more than WEBHOOK_LEASE_TIMEOUT
+    seconds, and returns it locked by `worker_id`. Returns None if there is nothing to do.
+
+    An event is skipped while an earlier event about the same object is still waiting or being processed,
+    so the events of an order are always handled in the order they arrived.
+    """
+    now = timezone.now()
+    earlier = WebhookEvent.objects.filter(
+        object_id=OuterRef('object_id'),
+        id__lt=OuterRef('id'),
+        status__in=[WebhookEvent.PENDING, WebhookEvent.PROCESSING],
+    )
+    candidates = WebhookEvent.objects.filter(
+        Q(status=WebhookEvent.PENDING, next_attempt_at__lte=now)
+        | Q(status=WebhookEvent.PROCESSING, locked_at__lte=now - timedelta(seconds=settings.WEBHOOK_LEASE_TIMEOUT))
+    ).filter(
+        Q(object_id='') | ~Exists(earlier)
+    ).order_by('id').values_list('id', 'status', 'locked_at')[:settings.WEBHOOK_CLAIM_BATCH]
+
+    for event_id, status, locked_at in candidates:
+        # Conditional update: of several workers seeing the same candidate, only one gets it
+        claimed = WebhookEvent.objects.filter(pk=event_id, status=status, locked_at=locked_at).update(
+            status=WebhookEvent.PROCESSING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            if status == WebhookEvent.PROCESSING:
+                logger.warning(f"Worker {worker_id} took over webhook event #{event_id} from a stale worker")
+            return WebhookEvent.objects.get(pk=event_id)
+    return None
+
+
+def process_event(event):
+    """
+    Handles a claimed event, then marks it processed, or schedules a retry with backoff if handling it failed.
+    After WEBHOOK_MAX_ATTEMPTS attempts the event is marked failed and left for inspection.
+    """
+    # Only the worker still holding the lease records the outcome
+    owned = WebhookEvent.objects.filter(pk=event.pk, locked_by=event.locked_by, locked_at=event.locked_at)
+    try:
+        handle_event(event.payload)
+    except Exception as e:
+        logger.exception(f"Processing webhook event {event.event_id} failed (attempt {event.attempts}): {str(e)}")
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            owned.update(status=WebhookEvent.FAILED, last_error=str(e), locked_by='', locked_at=None)
+            logger.error(f"Giving up on webhook event {event.event_id} after {event.attempts} attempts")
+        else:
+            owned.update(
+                status=WebhookEvent.PENDING,
+                last_error=str(e),
+                next_attempt_at=timezone.now() + timedelta(seconds=get_retry_delay(event.attempts)),
+                locked_by='',
+                locked_at=None,
+            )
+        return False
+
+    owned.update(status=WebhookEvent.PROCESSED, processed_at=timezone.now(), locked_by='', locked_at=None)
+    logger.info(f"Processed webhook event {event.event_id} ({event.type})")
+    return True
+
+
+def run_worker(worker_id, stop, drain=False):
+    """
+    Processes inbox events until `stop` (a threading.Event) is set, polling every WEBHOOK_POLL_INTERVAL
+    seconds while there is nothing to do. With `drain`, returns as soon as no event is due instead.
+    Returns the number of events handled.
+    """
+    handled = 0
+    while not stop.is_set():
+        event = claim_event(worker_id)
+        if event is None:
+            if drain:
+                break
+            stop.wait(settings.WEBHOOK_POLL_INTERVAL)
+            continue
+        process_event(event)
+        handled += 1
+    return handled
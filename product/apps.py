@@ -1,6 +1,46 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+
+
+SEARCH_INDEX_MIGRATION = ('product', '0004_product_search_index')
+# Backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Catalog changes bump a version in the default cache; with a cache of its own each server process keeps
+    serving the product responses it cached before the change (and misses idempotent replays, cart summary
+    invalidations and checkout statuses written by the others).
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.CACHE_ALLOW_PROCESS_LOCAL or backend not in PROCESS_LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Error(
+        f"The default cache ({backend}) is not shared between server processes.",
+        hint="Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis.",
+        id='product.E001',
+    )]
+
+
+def reinstall_search_index(sender, using, **kwargs):
+    from product.search import install_search_index
+
+    connection = connections[using]
+    if SEARCH_INDEX_MIGRATION in MigrationRecorder(connection).applied_migrations():
+        install_search_index(connection)
 
 
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        checks.register(check_shared_cache)
+        post_migrate.connect(reinstall_search_index, sender=self)
@@ -0,0 +1,187 @@
+import csv
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from product.cache import bump_catalog_version
+from product.facets import apply_facet_changes
+from product.models import Product
+from product.serializers import ProductSerializer
+
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+IMPORT_CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+# Columns rewritten when an imported row's id already exists. `created_at` keeps its original value.
+UPSERT_FIELDS = ['title', 'price', 'description', 'image', 'category', 'rating', 'updated_at']
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_FIELDS = ['id', 'title', 'price', 'description', 'image', 'category', 'rating', 'created_at', 'updated_at']
+
+
+def iter_records(lines, file_format):
+    """
+    Yields (row number, record) pairs from an iterable of text lines. A record that
+    can't be parsed is yielded as a string describing the problem.
+    """
+    if file_format == 'ndjson':
+        for row_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, f"Invalid JSON: {str(e)}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, "Each line must be a JSON object."
+                continue
+            yield row_number, record
+    elif file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # Empty cells are treated as missing so optional columns (like id) can be left blank
+            yield reader.line_num, {key: value for key, value in record.items() if key and value != ''}
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+def _build_product(record):
+    """
+    Validates a record with ProductSerializer. Returns (product, None) or (None, errors).
+    """
+    product_id = record.get('id')
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return None, {"id": ["A valid integer is required."]}
+
+    serializer = ProductSerializer(data=record)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return Product(id=product_id, **serializer.validated_data), None
+
+
+def _reset_id_sequence():
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+            cursor.execute(sql)
+
+
+def import_products(lines, file_format, batch_size=None):
+    """
+    Streams product records from `lines` and upserts them by id in fixed-size batches.
+
+    Each batch is validated and written in its own transaction, so memory use does not depend on the size of
+    the input. Rows with an `id` update that product (or create it with that id) through one
+    `bulk_create(update_conflicts=True)`; rows without one are inserted with a plain `bulk_create`. Invalid rows
+    are skipped and reported with their row number (up to PRODUCT_IMPORT_MAX_REPORTED_ERRORS of them).
+    """
+    batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+    report = {"processed": 0, "imported": 0, "failed": 0, "errors": []}
+    records = iter_records(lines, file_format)
+
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+
+        with_id = {}
+        without_id = []
+        for row_number, record in chunk:
+            report["processed"] += 1
+            if isinstance(record, str):
+                product, errors = None, {"non_field_errors": [record]}
+            else:
+                product, errors = _build_product(record)
+
+            if errors:
+                report["failed"] += 1
+                if len(report["errors"]) < settings.PRODUCT_IMPORT_MAX_REPORTED_ERRORS:
+                    report["errors"].append({"row": row_number, "errors": errors})
+            elif product.id is None:
+                without_id.append(product)
+            else:
+                # A row can't be upserted twice in one statement, the last occurrence wins
+                with_id[product.id] = product
+
+        products = list(with_id.values()) + without_id
+        if products:
+            with transaction.atomic():
+                # Existing rows are about to be overwritten, take their old values out of the facet counts
+                replaced = list(
+                    Product.objects.select_for_update().filter(id__in=with_id).values('category', 'price', 'rating')
+                )
+                if with_id:
+                    Product.objects.bulk_create(
+                        list(with_id.values()),
+                        update_conflicts=True,
+                        unique_fields=['id'],
+                        update_fields=UPSERT_FIELDS,
+                    )
+                    # Rows inserted with explicit ids don't advance the id sequence on Postgres. Move it past them
+                    # before any row gets an id from it, or that row would collide with one of them.
+                    _reset_id_sequence()
+                # A plain insert: a row without an id must never overwrite an existing product
+                Product.objects.bulk_create(without_id)
+                apply_facet_changes(removed=replaced, added=products)
+            report["imported"] += len(products)
+        logger.info(f"Product import progress: {report['processed']} rows processed, {report['imported']} imported")
+
+    if report["imported"]:
+        bump_catalog_version()
+    return report
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the value, so csv.writer can format a row without buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_products(file_format, chunk_size=None):
+    """
+    Yields the whole Product table as NDJSON or CSV text, one chunk of rows at a time.
+
+    Rows are read with `values_list(...).iterator(chunk_size=...)` (a server-side cursor on Postgres),
+    so neither model instances nor the full result set are ever held in memory.
+    """
+    chunk_size = chunk_size or settings.PRODUCT_EXPORT_CHUNK_SIZE
+    rows = Product.objects.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    if file_format == 'ndjson':
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        format_row = lambda row: encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+    elif file_format == 'csv':
+        writer = csv.writer(_Echo())
+        format_row = lambda row: writer.writerow([_csv_value(value) for value in row])
+        yield writer.writerow(EXPORT_FIELDS)
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield ''.join(format_row(row) for row in chunk)
@@ -0,0 +1,58 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CATALOG_VERSION_KEY = 'product:catalog_version'
+
+
+def get_catalog_version():
+    """
+    Returns the current catalog version, which is part of every product cache key.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock rather than 1 so an evicted counter never comes back
+        # at a value whose cache entries may still be around
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached product response by moving the catalog to a new version.
+    """
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def query_digest(query_params):
+    items = sorted((key, value) for key in query_params for value in query_params.getlist(key))
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+def catalog_cache_key(kind, *parts, version=None):
+    version = version or get_catalog_version()
+    return ':'.join(['product', str(version), kind, *map(str, parts)])
+
+
+def get_cached(key):
+    return cache.get(key)
+
+
+def set_cached(key, value):
+    cache.set(key, value, settings.PRODUCT_CACHE_TIMEOUT)
+
+
+def get_many_cached(keys):
+    return cache.get_many(keys)
+
+
+def set_many_cached(values):
+    cache.set_many(values, settings.PRODUCT_CACHE_TIMEOUT)
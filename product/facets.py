@@ -0,0 +1,115 @@
+from bisect import bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from product.models import Product, ProductFacetCount
+
+
+CATEGORY_FACET = 'category'
+RATING_FACET = 'rating'
+PRICE_FACET = 'price'
+
+
+def _get_edges(facet):
+    return settings.PRODUCT_RATING_BUCKETS if facet == RATING_FACET else settings.PRODUCT_PRICE_BUCKETS
+
+
+def _get_bucket(edges, value):
+    # Bucket keys are the lower bound of the band; values below the first bound go to the first band
+    return str(edges[max(bisect_right(edges, value) - 1, 0)])
+
+
+def _value(product, field):
+    return product[field] if isinstance(product, dict) else getattr(product, field)
+
+
+def get_product_buckets(product):
+    """
+    Returns the (facet, bucket) pairs a product (model instance or values() dict) is counted in.
+    """
+    return [
+        (CATEGORY_FACET, _value(product, 'category')),
+        (RATING_FACET, _get_bucket(_get_edges(RATING_FACET), _value(product, 'rating'))),
+        (PRICE_FACET, _get_bucket(_get_edges(PRICE_FACET), _value(product, 'price'))),
+    ]
+
+
+def apply_facet_changes(removed=(), added=()):
+    """
+    Incrementally updates the facet counts for products leaving (`removed`) and entering (`added`) the catalog.
+
+    An update is a removal of the old values plus an addition of the new ones. Only the buckets whose
+    count actually changes are touched, each with an atomic `count = count + delta`.
+    """
+    deltas = Counter()
+    for product in removed:
+        deltas.subtract(get_product_buckets(product))
+    for product in added:
+        deltas.update(get_product_buckets(product))
+    # Rows are always locked in (facet, bucket) order, so concurrent updates moving products between the same
+    # buckets in opposite directions can't deadlock
+    deltas = {key: deltas[key] for key in sorted(deltas) if deltas[key]}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        ProductFacetCount.objects.bulk_create(
+            [ProductFacetCount(facet=facet, bucket=bucket) for facet, bucket in deltas],
+            ignore_conflicts=True,
+        )
+        for (facet, bucket), delta in deltas.items():
+            ProductFacetCount.objects.filter(facet=facet, bucket=bucket).update(count=F('count') + delta)
+
+
+def _bucket_expression(field, edges):
+    whens = [When(**{f"{field}__gte": edge}, then=Value(str(edge))) for edge in reversed(edges[1:])]
+    return Case(*whens, default=Value(str(edges[0])))
+
+
+def rebuild_facets(product_model=Product, facet_model=ProductFacetCount):
+    """
+    Recomputes every facet count from the product table with one GROUP BY per facet.
+    """
+    counts = []
+    for row in product_model.objects.values('category').annotate(count=Count('id')).order_by():
+        counts.append(facet_model(facet=CATEGORY_FACET, bucket=row['category'], count=row['count']))
+    for facet in (RATING_FACET, PRICE_FACET):
+        rows = (
+            product_model.objects
+            .annotate(bucket=_bucket_expression(facet, _get_edges(facet)))
+            .values('bucket')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            counts.append(facet_model(facet=facet, bucket=row['bucket'], count=row['count']))
+
+    with transaction.atomic():
+        facet_model.objects.all().delete()
+        facet_model.objects.bulk_create(counts)
+    return len(counts)
+
+
+def get_facets():
+    """
+    Returns the non-empty category counts (largest first) and the rating and price histograms.
+    """
+    counts = {CATEGORY_FACET: {}, RATING_FACET: {}, PRICE_FACET: {}}
+    for facet, bucket, count in ProductFacetCount.objects.filter(count__gt=0).values_list('facet', 'bucket', 'count'):
+        counts.setdefault(facet, {})[bucket] = count
+
+    categories = sorted(counts[CATEGORY_FACET].items(), key=lambda item: (-item[1], item[0]))
+    facets = {"categories": [{"category": category, "count": count} for category, count in categories]}
+    for facet, name in ((RATING_FACET, "ratings"), (PRICE_FACET, "prices")):
+        edges = _get_edges(facet)
+        facets[name] = [
+            {
+                "min": edge,
+                "max": edges[index + 1] if index + 1 < len(edges) else None,
+                "count": counts[facet].get(str(edge), 0),
+            }
+            for index, edge in enumerate(edges)
+        ]
+    return facets
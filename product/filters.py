@@ -0,0 +1,66 @@
+from decimal import Decimal, InvalidOperation
+from rest_framework import exceptions
+
+
+# Sort options exposed through `?sort=`. Each ordering is backed by one of the indexes
+# declared on `Product.Meta` (with or without the leading `category` column).
+PRODUCT_SORT_OPTIONS = {
+    'id': ('id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'rating': ('rating', 'id'),
+    '-rating': ('-rating', '-id'),
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+}
+DEFAULT_PRODUCT_SORT = 'id'
+
+
+def _parse_decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise exceptions.ValidationError({name: "Must be a number."})
+
+
+def _parse_float(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise exceptions.ValidationError({name: "Must be a number."})
+
+
+def get_product_ordering(params):
+    """
+    Returns the ordering tuple for the `sort` query parameter.
+    """
+    sort = params.get('sort') or DEFAULT_PRODUCT_SORT
+    if sort not in PRODUCT_SORT_OPTIONS:
+        raise exceptions.ValidationError({"sort": f"Must be one of: {', '.join(PRODUCT_SORT_OPTIONS)}."})
+    return PRODUCT_SORT_OPTIONS[sort]
+
+
+def filter_products(queryset, params):
+    """
+    Applies the `category`, `min_price`, `max_price` and `min_rating` query parameters to a Product queryset.
+    """
+    category = params.get('category')
+    min_price = _parse_decimal(params, 'min_price')
+    max_price = _parse_decimal(params, 'max_price')
+    min_rating = _parse_float(params, 'min_rating')
+
+    if category:
+        queryset = queryset.filter(category=category)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if min_rating is not None:
+        queryset = queryset.filter(rating__gte=min_rating)
+    return queryset
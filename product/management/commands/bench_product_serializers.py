@@ -0,0 +1,59 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from product.models import Product
+from product.serializers import PRODUCT_READ_FIELDS, ProductReadSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares ProductSerializer with the fast-path ProductReadSerializer on a seeded catalog (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        title=f"Benchmark product {index}",
+                        price=f"{index % 1000}.99",
+                        description="Lorem ipsum dolor sit amet " * 20,
+                        image=f"https://example.com/images/{index}.png",
+                        category=f"category-{index % 25}",
+                        rating=(index % 50) / 10,
+                    )
+                    for index in range(rows)
+                ],
+                batch_size=1000,
+            )
+            queryset = Product.objects.order_by('id')[:rows]
+            read_serializer = ProductReadSerializer()
+            sparse_serializer = ProductReadSerializer(('id', 'title', 'price', 'image'))
+
+            results = [
+                ("ModelSerializer", self.best_of(repeat, lambda: ProductSerializer(list(queryset), many=True).data)),
+                ("ProductReadSerializer", self.best_of(
+                    repeat, lambda: read_serializer.serialize_many(queryset.values(*PRODUCT_READ_FIELDS))
+                )),
+                ("ProductReadSerializer ?fields=title,price,image", self.best_of(
+                    repeat, lambda: sparse_serializer.serialize_many(queryset.values(*sparse_serializer.fields))
+                )),
+            ]
+            transaction.set_rollback(True)
+
+        baseline = results[0][1]
+        self.stdout.write(f"Fetch + serialize {rows} products, best of {repeat}:")
+        for name, seconds in results:
+            self.stdout.write(f"  {name:<50} {seconds * 1000:9.1f} ms  {baseline / seconds:5.1f}x")
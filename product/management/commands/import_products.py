@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from product.bulk import IMPORT_FORMATS, import_products
+
+
+class Command(BaseCommand):
+    help = "Upserts products from an NDJSON or CSV file in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' to read from stdin")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction (defaults to PRODUCT_IMPORT_BATCH_SIZE)")
+
+    def get_format(self, options):
+        if options['format']:
+            return options['format']
+        extension = options['path'].rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+        raise CommandError("Could not infer the file format, pass --format")
+
+    def handle(self, *args, **options):
+        file_format = self.get_format(options)
+
+        if options['path'] == '-':
+            report = import_products(sys.stdin, file_format, options['batch_size'])
+        else:
+            try:
+                with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                    report = import_products(f, file_format, options['batch_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {report['processed']} rows: {report['imported']} imported, {report['failed']} failed"
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from product.cache import bump_catalog_version
+from product.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = "Recomputes the product facet counts (category, rating and price buckets) from scratch"
+
+    def handle(self, *args, **options):
+        buckets = rebuild_facets()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} facet buckets"))
@@ -0,0 +1,21 @@
+from django.db import migrations
+from product.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_product_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-17 22:15
+
+from django.db import migrations, models
+from product.facets import rebuild_facets
+
+
+def build_facet_counts(apps, schema_editor):
+    rebuild_facets(apps.get_model('product', 'Product'), apps.get_model('product', 'ProductFacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('bucket', models.CharField(max_length=255)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='productfacetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'bucket'), name='product_facet_bucket_unique'),
+        ),
+        migrations.RunPython(build_facet_counts, migrations.RunPython.noop),
+    ]
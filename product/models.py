@@ -8,6 +8,39 @@ class Product(models.Model):
     image = models.URLField()
     category = models.CharField(max_length=255)
     rating = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Every catalog sort ends with `id` as a tie-breaker for keyset pagination, so the
+        # indexes carry it too. Category filters use the composite ones, the rest the plain ones.
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'rating', 'id'], name='product_category_rating_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_category_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class ProductFacetCount(models.Model):
+    """
+    Denormalized number of products per facet bucket (category, rating band, price band),
+    kept up to date by the product write paths so facet reads never scan the catalog.
+    """
+    facet = models.CharField(max_length=20)
+    bucket = models.CharField(max_length=255)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'bucket'], name='product_facet_bucket_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.bucket}: {self.count}"
@@ -0,0 +1,127 @@
+import re
+
+
+# Title matches weigh more than description matches in both backends.
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+SQLITE_FTS_TABLE = 'product_product_fts'
+SQLITE_TRIGGERS = {
+    'product_product_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS product_product_fts_insert AFTER INSERT ON product_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """,
+    'product_product_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS product_product_fts_delete AFTER DELETE ON product_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+    """,
+    'product_product_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS product_product_fts_update AFTER UPDATE OF title, description ON product_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """,
+}
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE product_product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS product_search_vector_idx ON product_product USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "ALTER TABLE product_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_search_index(connection):
+    """
+    Creates the inverted index over Product.title/description and the database-side hooks that keep it in sync.
+
+    SQLite uses an external-content FTS5 table maintained by triggers, Postgres a generated `tsvector` column with
+    a GIN index. Safe to call repeatedly: Django rebuilds SQLite tables (dropping their triggers) when a migration
+    alters Product, so this also runs after every `migrate`.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+                f"title, description, content='product_product', content_rowid='id')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'product_product'"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            if not set(SQLITE_TRIGGERS) <= existing:
+                for sql in SQLITE_TRIGGERS.values():
+                    cursor.execute(sql)
+                # Rows may have been written while the triggers were missing
+                cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            for sql in POSTGRES_UNINSTALL:
+                cursor.execute(sql)
+
+
+def _sqlite_match_query(query):
+    # Quote every term so user input can't use (or break) the FTS5 query syntax
+    terms = re.findall(r'\w+', query)
+    return ' '.join('"{}"'.format(term) for term in terms)
+
+
+def search_product_ids(connection, query, limit, after=None):
+    """
+    Returns up to `limit` (score, product id) pairs matching `query`, best match first.
+
+    Lower scores rank higher in both backends, so results are ordered by (score, id) and `after`
+    (the last pair of the previous page) continues the listing with a keyset condition.
+    """
+    if connection.vendor == 'sqlite':
+        match = _sqlite_match_query(query)
+        if not match:
+            return []
+        ranked = (
+            f"SELECT rowid AS id, bm25({SQLITE_FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score "
+            f"FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s"
+        )
+        params = [match]
+    elif connection.vendor == 'postgresql':
+        # Negated so that, like bm25, a lower score is a better match. Cast to float8 so the value
+        # round-trips through the cursor exactly.
+        ranked = (
+            "SELECT id, (-ts_rank_cd(search_vector, query))::float8 AS score "
+            "FROM product_product, websearch_to_tsquery('english', %s) query "
+            "WHERE search_vector @@ query"
+        )
+        params = [query]
+    else:
+        raise NotImplementedError(f"Full-text search is not supported on {connection.vendor}")
+
+    sql = f"SELECT score, id FROM ({ranked}) ranked"
+    if after is not None:
+        sql += " WHERE score > %s OR (score = %s AND id > %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score, id LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
@@ -1,4 +1,6 @@
-from rest_framework import serializers
+from decimal import Decimal
+from django.utils import timezone
+from rest_framework import exceptions, serializers
 from product.models import Product
 
 
@@ -6,3 +8,75 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+
+
+PRODUCT_READ_FIELDS = ('id', 'title', 'price', 'description', 'image', 'category', 'rating', 'created_at', 'updated_at')
+
+
+def get_requested_fields(query_params):
+    """
+    Returns the product fields selected with `?fields=a,b,c` (all fields if omitted). `id` is always included.
+    """
+    fields = query_params.get('fields')
+    if not fields:
+        return PRODUCT_READ_FIELDS
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested.difference(PRODUCT_READ_FIELDS)
+    if unknown:
+        raise exceptions.ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}."})
+    requested.add('id')
+    return tuple(field for field in PRODUCT_READ_FIELDS if field in requested)
+
+
+def _decimal_to_string(value, tz, _cents=Decimal('0.01')):
+    return '{:f}'.format(value.quantize(_cents))
+
+
+def _to_float(value, tz):
+    return float(value)
+
+
+def _datetime_to_string(value, tz):
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class ProductReadSerializer:
+    """
+    Read-only serializer for `Product.objects.values(...)` rows.
+
+    Produces the same representation as ProductSerializer, but the per-field converters are
+    resolved once up front instead of running DRF field machinery for every row. Used on the
+    product read paths, where that overhead dominates the response time for large pages.
+    """
+    converters = {
+        'id': None,
+        'title': None,
+        'price': _decimal_to_string,
+        'description': None,
+        'image': None,
+        'category': None,
+        'rating': _to_float,
+        'created_at': _datetime_to_string,
+        'updated_at': _datetime_to_string,
+    }
+
+    def __init__(self, fields=PRODUCT_READ_FIELDS):
+        self.fields = tuple(fields)
+        self._plan = [(field, self.converters[field]) for field in self.fields]
+
+    def to_representation(self, row, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        representation = {}
+        for field, converter in self._plan:
+            value = row[field]
+            representation[field] = value if converter is None or value is None else converter(value, tz)
+        return representation
+
+    def serialize_many(self, rows):
+        # Resolved once per page rather than once per datetime value
+        tz = timezone.get_current_timezone()
+        to_representation = self.to_representation
+        return [to_representation(row, tz) for row in rows]
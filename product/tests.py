@@ -1,3 +1,588 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from product.apps import check_shared_cache
+from product.bulk import import_products
+from product.facets import apply_facet_changes, get_facets, rebuild_facets
+from product.filters import PRODUCT_SORT_OPTIONS, filter_products
+from product.models import Product, ProductFacetCount
+from product.serializers import ProductReadSerializer, ProductSerializer
 
-# Create your tests here.
+
+class ProductFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        for index in range(6):
+            Product.objects.create(
+                title=f"Product {index}",
+                price=10 * (index + 1),
+                description="Description",
+                image="https://example.com/image.png",
+                category='books' if index % 2 else 'games',
+                rating=index,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_filters_and_sorts_products(self):
+        response = self.client.get('/api/products/', {'category': 'books', 'min_price': 30, 'sort': '-price'})
+
+        self.assertEqual(response.status_code, 200)
+        prices = [product['price'] for product in response.data['data']['results']]
+        self.assertEqual(prices, ['60.00', '40.00'])
+
+    def test_pages_through_sorted_products(self):
+        response = self.client.get('/api/products/', {'sort': '-rating', 'limit': 4})
+        next_cursor = response.data['data']['next_cursor']
+        response = self.client.get('/api/products/', {'sort': '-rating', 'limit': 4, 'cursor': next_cursor})
+
+        ratings = [product['rating'] for product in response.data['data']['results']]
+        self.assertEqual(ratings, [1.0, 0.0])
+        self.assertIsNone(response.data['data']['next_cursor'])
+
+    def test_rejects_unknown_sort(self):
+        response = self.client.get('/api/products/', {'sort': 'title'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price=10 if index < 3 else 20,
+                description="Description",
+                image="https://example.com/image.png",
+                category='books',
+                rating=3,
+            )
+            for index in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect_ids(self, params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get('/api/products/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids += [product['id'] for product in response.data['data']['results']]
+            cursor = response.data['data']['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_cursors_walk_every_row_once(self):
+        self.assertEqual(self.collect_ids({'limit': 2}), [product.id for product in self.products])
+
+    def test_equal_sort_keys_are_broken_by_id(self):
+        ids = self.collect_ids({'sort': '-price', 'limit': 1})
+
+        self.assertEqual(ids, [product.id for product in self.products[3:][::-1] + self.products[:3][::-1]])
+
+    def test_rows_in_the_same_millisecond_are_not_skipped(self):
+        created_at = timezone.now().replace(microsecond=123000)
+        for offset, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(created_at=created_at + timedelta(microseconds=offset * 100))
+
+        ids = self.collect_ids({'sort': 'newest', 'limit': 1})
+
+        self.assertEqual(ids, [product.id for product in reversed(self.products)])
+
+    @override_settings(PAGINATION_MAX_LIMIT=3)
+    def test_limit_is_capped_and_validated(self):
+        response = self.client.get('/api/products/', {'limit': 100})
+        self.assertEqual(len(response.data['data']['results']), 3)
+
+        self.assertEqual(self.client.get('/api/products/', {'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/', {'limit': 0}).status_code, 400)
+
+    def test_rejects_invalid_cursors(self):
+        self.assertEqual(self.client.get('/api/products/', {'cursor': 'not-a-cursor'}).status_code, 400)
+
+        # A cursor issued for another ordering has the wrong number of values
+        cursor = self.client.get('/api/products/', {'sort': 'price', 'limit': 1}).data['data']['next_cursor']
+        self.assertEqual(self.client.get('/api/products/', {'cursor': cursor}).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plan assertions are written for SQLite")
+class ProductQueryPlanTests(TestCase):
+    def get_plan(self, params):
+        queryset = filter_products(Product.objects.all(), params)
+        return queryset.order_by(*PRODUCT_SORT_OPTIONS[params['sort']])[:20].explain()
+
+    def test_category_filter_uses_composite_index(self):
+        plans = {
+            'price': 'product_category_price_idx',
+            '-rating': 'product_category_rating_idx',
+            'newest': 'product_category_created_idx',
+        }
+        for sort, index in plans.items():
+            with self.subTest(sort=sort):
+                plan = self.get_plan({'category': 'books', 'sort': sort})
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_price_range_uses_price_index(self):
+        plan = self.get_plan({'min_price': '10', 'max_price': '50', 'sort': 'price'})
+
+        self.assertIn('product_price_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_min_rating_uses_rating_index(self):
+        plan = self.get_plan({'min_rating': '4', 'sort': '-rating'})
+
+        self.assertIn('product_rating_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='Secret@123', email='admin@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_product(self, title, description):
+        response = self.client.post('/api/products/', {
+            'title': title,
+            'price': '10.00',
+            'description': description,
+            'image': 'https://example.com/image.png',
+            'category': 'shoes',
+            'rating': 4,
+        })
+        return response.data['data']['id']
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        return [product['id'] for product in response.data['data']['results']]
+
+    def test_ranks_title_matches_first(self):
+        in_description = self.create_product("Trail runner", "A red running shoe")
+        in_title = self.create_product("Red sneaker", "Canvas upper")
+
+        self.assertEqual(self.search('red'), [in_title, in_description])
+
+    def test_index_follows_updates_and_deletes(self):
+        product_id = self.create_product("Blue sandal", "Summer wear")
+
+        self.client.patch(f'/api/products/{product_id}/', {'title': "Green sandal"})
+        self.assertEqual(self.search('blue'), [])
+        self.assertEqual(self.search('green'), [product_id])
+
+        self.client.delete(f'/api/products/{product_id}/')
+        self.assertEqual(self.search('green'), [])
+
+
+class ProductCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='Secret@123', email='admin@example.com')
+        cls.product = Product.objects.create(
+            title="Lamp",
+            price='25.00',
+            description="Desk lamp",
+            image="https://example.com/lamp.png",
+            category='home',
+            rating=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_cache_hit_skips_database(self):
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.product.id}/')
+
+        with self.assertNumQueries(0):
+            list_response = self.client.get('/api/products/')
+            detail_response = self.client.get(f'/api/products/{self.product.id}/')
+
+        self.assertEqual(list_response.data['data']['results'][0]['title'], "Lamp")
+        self.assertEqual(detail_response.data['data']['title'], "Lamp")
+
+    def test_writes_invalidate_cache(self):
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.product.id}/')
+
+        self.client.patch(f'/api/products/{self.product.id}/', {'title': "Floor lamp"})
+
+        list_response = self.client.get('/api/products/')
+        detail_response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(list_response.data['data']['results'][0]['title'], "Floor lamp")
+        self.assertEqual(detail_response.data['data']['title'], "Floor lamp")
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def get_error_ids(self, backend):
+        with override_settings(CACHES={'default': {'BACKEND': backend, 'LOCATION': 'redis://localhost'}}):
+            return [error.id for error in check_shared_cache(None)]
+
+    @override_settings(CACHE_ALLOW_PROCESS_LOCAL=False)
+    def test_process_local_cache_is_refused(self):
+        self.assertEqual(self.get_error_ids('django.core.cache.backends.locmem.LocMemCache'), ['product.E001'])
+        self.assertEqual(self.get_error_ids('django.core.cache.backends.redis.RedisCache'), [])
+
+    @override_settings(CACHE_ALLOW_PROCESS_LOCAL=True)
+    def test_process_local_cache_is_allowed_for_development(self):
+        self.assertEqual(self.get_error_ids('django.core.cache.backends.locmem.LocMemCache'), [])
+
+
+class ProductConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='Secret@123', email='admin@example.com')
+        cls.product = Product.objects.create(
+            title="Mug",
+            price='8.00',
+            description="Coffee mug",
+            image="https://example.com/mug.png",
+            category='kitchen',
+            rating=4,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_unchanged_resources_return_304(self):
+        self.assertTrue(self.client.get(f'/api/products/{self.product.id}/').has_header('Last-Modified'))
+        for url in ['/api/products/', f'/api/products/{self.product.id}/']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_changed_resources_return_200(self):
+        list_etag = self.client.get('/api/products/')['ETag']
+        detail_etag = self.client.get(f'/api/products/{self.product.id}/')['ETag']
+
+        self.client.patch(f'/api/products/{self.product.id}/', {'price': '9.00'})
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/api/products/{self.product.id}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['price'], '9.00')
+
+    def test_list_is_not_stale_after_a_delete(self):
+        newer = Product.objects.create(
+            title="Cup", price='3.00', description="Cup", image="https://example.com/cup.png", category='kitchen',
+            rating=3,
+        )
+        self.client.get('/api/products/')
+        self.client.delete(f'/api/products/{newer.id}/')
+
+        # Only If-Modified-Since, as sent by clients that only kept the date
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.data['data']['results']], [self.product.id])
+
+
+class ProductReadSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.product = Product.objects.create(
+            title="Kettle",
+            price='19.9',
+            description="Electric kettle",
+            image="https://example.com/kettle.png",
+            category='kitchen',
+            rating=4.5,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_matches_model_serializer(self):
+        row = Product.objects.values().get(id=self.product.id)
+        product = Product.objects.get(id=self.product.id)
+
+        self.assertEqual(ProductReadSerializer().to_representation(row), ProductSerializer(product).data)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/products/', {'fields': 'title,price'})
+        self.assertEqual(response.data['data']['results'], [{'id': self.product.id, 'title': "Kettle", 'price': '19.90'}])
+
+        response = self.client.get(f'/api/products/{self.product.id}/', {'fields': 'rating'})
+        self.assertEqual(response.data['data'], {'id': self.product.id, 'rating': 4.5})
+
+    def test_rejects_unknown_fields(self):
+        response = self.client.get('/api/products/', {'fields': 'title,secret'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='Secret@123', email='admin@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_product(self, category, price, rating):
+        response = self.client.post('/api/products/', {
+            'title': "Item",
+            'price': price,
+            'description': "Description",
+            'image': 'https://example.com/image.png',
+            'category': category,
+            'rating': rating,
+        })
+        return response.data['data']['id']
+
+    def test_counts_follow_writes(self):
+        first = self.create_product('books', '12.00', 4.5)
+        self.create_product('books', '5.00', 3)
+        third = self.create_product('games', '60.00', 5)
+
+        self.client.patch(f'/api/products/{first}/', {'category': 'games', 'price': '9.99'})
+        self.client.delete(f'/api/products/{third}/')
+
+        response = self.client.get('/api/products/facets/')
+        facets = response.data['data']
+        self.assertEqual(facets['categories'], [
+            {'category': 'books', 'count': 1},
+            {'category': 'games', 'count': 1},
+        ])
+        self.assertEqual(facets['prices'][0], {'min': 0, 'max': 10, 'count': 2})
+        self.assertEqual(facets['ratings'][4], {'min': 4, 'max': 5, 'count': 1})
+
+        rebuild_facets()
+        self.assertEqual(get_facets(), facets)
+
+    def test_failed_writes_leave_counts_alone(self):
+        first = self.create_product('books', '12.00', 4.5)
+        second = self.create_product('games', '60.00', 5)
+
+        self.assertEqual(self.client.delete(f'/api/products/{second}/').status_code, 204)
+        # A second delete of the same product (like the loser of two concurrent deletes) changes nothing
+        self.assertEqual(self.client.delete(f'/api/products/{second}/').status_code, 404)
+        self.assertEqual(self.client.patch(f'/api/products/{first}/', {'price': 'free'}).status_code, 400)
+        self.assertEqual(self.client.patch(f'/api/products/{second}/', {'price': '1.00'}).status_code, 404)
+
+        facets = get_facets()
+        rebuild_facets()
+        self.assertEqual(get_facets(), facets)
+
+    def test_buckets_are_updated_in_a_fixed_order(self):
+        books = {'category': 'books', 'price': 5, 'rating': 3}
+        games = {'category': 'games', 'price': 60, 'rating': 5}
+        orders = []
+        for removed, added in ((books, games), (games, books)):
+            with mock.patch.object(
+                ProductFacetCount.objects, 'filter', wraps=ProductFacetCount.objects.filter
+            ) as facet_filter:
+                apply_facet_changes(removed=[removed], added=[added])
+            orders.append([(call.kwargs['facet'], call.kwargs['bucket']) for call in facet_filter.call_args_list])
+
+        # Opposite moves lock the same rows in the same order
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], sorted(orders[0]))
+
+
+class ProductBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='Secret@123')
+        cls.products = [
+            Product.objects.create(
+                title=f"Pen {index}",
+                price='2.50',
+                description="Ballpoint pen",
+                image="https://example.com/pen.png",
+                category='office',
+                rating=3,
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_keeps_requested_order_and_reports_missing(self):
+        first, second, third = (product.id for product in self.products)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/batch/', {'ids': f'{third},999,{first},{third}'})
+
+        self.assertEqual([product['id'] for product in response.data['data']['results']], [third, first])
+        self.assertEqual(response.data['data']['missing'], [999])
+
+    def test_reuses_cached_products(self):
+        first, second, third = (product.id for product in self.products)
+        self.client.get('/api/products/batch/', {'ids': f'{first},{second},{third}'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/batch/', {'ids': f'{second},{first}'})
+
+        self.assertEqual([product['id'] for product in response.data['data']['results']], [second, first])
+
+    @override_settings(PRODUCT_BATCH_MAX_IDS=2)
+    def test_rejects_too_many_ids(self):
+        response = self.client.get('/api/products/batch/', {'ids': '1,2,3'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+def product_record(**fields):
+    return {
+        'title': "Imported",
+        'price': '5.00',
+        'description': "Description",
+        'image': "https://example.com/image.png",
+        'category': 'games',
+        'rating': 2,
+        **fields,
+    }
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.existing = Product.objects.create(**product_record(title="Existing"))
+
+    def import_ndjson(self, records, batch_size=None):
+        lines = [record if isinstance(record, str) else json.dumps(record) for record in records]
+        return import_products(lines, 'ndjson', batch_size)
+
+    def test_upserts_rows_with_an_id_and_inserts_the_others(self):
+        ahead = self.existing.id + 100
+        report = self.import_ndjson([
+            product_record(id=self.existing.id, title="Renamed"),
+            product_record(id=ahead, title="Explicit id"),
+            product_record(title="New"),
+        ])
+
+        self.assertEqual((report['imported'], report['failed']), (3, 0))
+        self.assertEqual(Product.objects.get(pk=self.existing.id).title, "Renamed")
+        self.assertEqual(Product.objects.get(pk=ahead).title, "Explicit id")
+        self.assertGreater(Product.objects.get(title="New").id, ahead)
+
+    def test_rows_without_an_id_never_overwrite_explicit_ones(self):
+        ahead = self.existing.id + 1
+        # One row per batch: the explicit id is written before the next row takes an id from the sequence
+        report = self.import_ndjson([
+            product_record(id=ahead, title="Explicit id"),
+            product_record(title="First new"),
+            product_record(title="Second new"),
+        ], batch_size=1)
+
+        self.assertEqual(report['imported'], 3)
+        self.assertEqual(Product.objects.get(pk=ahead).title, "Explicit id")
+        self.assertEqual(Product.objects.filter(title__endswith=" new").count(), 2)
+        self.assertEqual(Product.objects.count(), 4)
+
+    def test_reports_invalid_rows_by_row_number(self):
+        report = self.import_ndjson([
+            product_record(title="Valid"),
+            '{not json',
+            product_record(id='abc'),
+            product_record(price='free'),
+            '',
+            '[1, 2]',
+            product_record(title="Also valid"),
+        ], batch_size=2)
+
+        self.assertEqual((report['processed'], report['imported'], report['failed']), (6, 2, 4))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4, 6])
+        self.assertIn('price', report['errors'][2]['errors'])
+
+    def test_imports_csv_in_batches(self):
+        rows = ['id,title,price,description,image,category,rating'] + [
+            f",CSV {index},{index}.50,Description,https://example.com/image.png,books,3" for index in range(5)
+        ]
+
+        with mock.patch('product.bulk.apply_facet_changes') as apply_facet_changes:
+            report = import_products(rows, 'csv', batch_size=2)
+
+        self.assertEqual((report['processed'], report['imported'], report['failed']), (5, 5, 0))
+        self.assertEqual(apply_facet_changes.call_count, 3)
+        self.assertEqual(Product.objects.filter(category='books').count(), 5)
+
+
+@override_settings(PRODUCT_EXPORT_CHUNK_SIZE=2)
+class ProductExportTests(TestCase):
+    # Everything but the timestamps, which an import sets anew
+    compared_fields = ['id', 'title', 'price', 'description', 'image', 'category', 'rating']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='Secret@123')
+        for index in range(5):
+            Product.objects.create(**product_record(title=f"Product, \"{index}\"", price=f"{index}.25", rating=index))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, file_format):
+        response = self.client.get('/api/products/export/', {'file_format': file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    def get_catalog(self):
+        return list(Product.objects.order_by('id').values_list(*self.compared_fields))
+
+    def test_streams_ndjson_in_chunks(self):
+        chunks = self.export('ndjson')
+
+        self.assertEqual(len(chunks), 3)
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([record['id'] for record in records], list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_streams_csv_in_chunks(self):
+        chunks = self.export('csv')
+
+        # The header, then one chunk per two rows
+        self.assertEqual(len(chunks), 4)
+        rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+        self.assertEqual([row['title'] for row in rows], [f"Product, \"{index}\"" for index in range(5)])
+
+    def test_export_then_import_preserves_the_catalog(self):
+        for file_format in ('ndjson', 'csv'):
+            catalog = self.get_catalog()
+            exported = ''.join(self.export(file_format))
+            Product.objects.all().delete()
+
+            report = import_products(io.StringIO(exported), file_format)
+
+            self.assertEqual((report['imported'], report['failed']), (5, 0))
+            self.assertEqual(self.get_catalog(), catalog)
@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import ProductListCreateView, ProductRetrieveUpdateDeleteView
+from .views import (
+    ProductListCreateView, ProductRetrieveUpdateDeleteView, ProductSearchView, ProductBatchView, ProductFacetView,
+    ProductImportView, ProductExportView
+)
 
 app_name = 'products'
 
 urlpatterns = [
     path('', ProductListCreateView.as_view(), name='product_list_create'),  # List and create products
+    path('search/', ProductSearchView.as_view(), name='product_search'),  # Ranked full-text search
+    path('batch/', ProductBatchView.as_view(), name='product_batch'),  # Fetch several products by id
+    path('facets/', ProductFacetView.as_view(), name='product_facets'),  # Category counts, rating and price histograms
+    path('import/', ProductImportView.as_view(), name='product_import'),  # Bulk import (NDJSON/CSV)
+    path('export/', ProductExportView.as_view(), name='product_export'),  # Streaming catalog export (NDJSON/CSV)
     path('<int:id>/', ProductRetrieveUpdateDeleteView.as_view(), name='product_retrieve_update_delete'),  # Retrieve, update, and delete products
 ]
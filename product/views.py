@@ -1,8 +1,22 @@
+import codecs
 import logging
+from product.bulk import EXPORT_FORMATS, IMPORT_CONTENT_TYPES, export_products, import_products
+from product.cache import (
+    bump_catalog_version, catalog_cache_key, get_catalog_version, get_cached, get_many_cached, set_cached, set_many_cached,
+    query_digest
+)
+from product.facets import apply_facet_changes, get_facets
+from product.filters import filter_products, get_product_ordering
 from product.models import Product
-from product.serializers import ProductSerializer
+from product.search import search_product_ids
+from product.serializers import ProductReadSerializer, ProductSerializer, get_requested_fields
 from mutaengine.base_view import BaseAPIView
-from mutaengine.utils import custom_response
+from mutaengine.pagination import CursorPaginator, decode_cursor, encode_cursor
+from mutaengine.utils import custom_response, get_not_modified_response, make_etag, set_validator_headers
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Count, Max
 from rest_framework import status, generics, exceptions
 from rest_framework.permissions import IsAuthenticated
 
@@ -13,14 +27,45 @@ logger = logging.getLogger(__name__)
 class ProductListCreateView(BaseAPIView, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     
+    def get_list_etag(self, request, digest):
+        # No Last-Modified: the newest updated_at doesn't move when a product is deleted or leaves the filter,
+        # the count in the ETag does
+        cache_key = catalog_cache_key('list-etag', digest)
+        etag = get_cached(cache_key)
+        if etag is None:
+            products = filter_products(Product.objects.all(), request.query_params)
+            summary = products.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+            etag = make_etag('list', digest, summary['count'], summary['last_modified'])
+            set_cached(cache_key, etag)
+        return etag
+
     def list_products(self, request, *args, **kwargs):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return custom_response(
+        fields = get_requested_fields(request.query_params)
+        digest = query_digest(request.query_params)
+        etag = self.get_list_etag(request, digest)
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        cache_key = catalog_cache_key('list', digest)
+        data = get_cached(cache_key)
+        if data is None:
+            paginator = CursorPaginator(ordering=get_product_ordering(request.query_params))
+            # Only the requested columns (plus the sort key) are selected
+            products = Product.objects.values(*set(fields).union(paginator.fields))
+            products = filter_products(products, request.query_params)
+            products, next_cursor = paginator.paginate(request, products)
+            data = {
+                "results": ProductReadSerializer(fields).serialize_many(products),
+                "next_cursor": next_cursor,
+            }
+            set_cached(cache_key, data)
+        response = custom_response(
             message="Products fetched successfully",
-            data=serializer.data,
+            data=data,
             status_code=status.HTTP_200_OK
         )
+        return set_validator_headers(response, etag)
     
     def create_product(self, request, *args, **kwargs):
         if not request.user.is_superuser:
@@ -28,7 +73,10 @@ class ProductListCreateView(BaseAPIView, generics.ListCreateAPIView):
             raise exceptions.PermissionDenied
         serializer = ProductSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                product = serializer.save()
+                apply_facet_changes(added=[product])
+            bump_catalog_version()
             logger.info(f"{request.user.username} added new product.\nDetails: {serializer.data}")
             return custom_response(
                 message="Product added successfully",
@@ -54,50 +102,78 @@ class ProductRetrieveUpdateDeleteView(BaseAPIView, generics.RetrieveUpdateDestro
 
     def get_product(self, request, *args, **kwargs):
         product_id = kwargs.get('id')
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return custom_response(
-                message="Product not found",
-                data={},
-                status_code=status.HTTP_404_NOT_FOUND
-            )
-        serializer = ProductSerializer(product)
-        return custom_response(
+        fields = get_requested_fields(request.query_params)
+        modified_key = catalog_cache_key('detail-modified', product_id)
+        last_modified = get_cached(modified_key)
+        product = None
+        if last_modified is None:
+            product = Product.objects.filter(id=product_id).values(*set(fields).union(['updated_at'])).first()
+            if not product:
+                return custom_response(
+                    message="Product not found",
+                    data={},
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+            last_modified = product['updated_at']
+            set_cached(modified_key, last_modified)
+
+        etag = make_etag('detail', product_id, last_modified, fields)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        cache_key = catalog_cache_key('detail', product_id, ','.join(fields))
+        data = get_cached(cache_key)
+        if data is None:
+            product = product or Product.objects.filter(id=product_id).values(*fields).first()
+            if not product:
+                return custom_response(
+                    message="Product not found",
+                    data={},
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+            data = ProductReadSerializer(fields).to_representation(product)
+            set_cached(cache_key, data)
+        response = custom_response(
             message="Product fetched successfully",
-            data=serializer.data,
+            data=data,
             status_code=status.HTTP_200_OK
         )
+        return set_validator_headers(response, etag, last_modified)
     
     def update_product(self, request, *args, **kwargs):
         if not request.user.is_superuser:
             logger.error(f"{request.user.username} tried to update a product.\nData:{request.data}")
             raise exceptions.PermissionDenied
         product_id = kwargs.get('id')
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            logger.info(f"{request.user.username} tried to update non existing product with id: {product_id}")
-            return custom_response(
-                message="Product not found",
-                data={},
-                status_code=status.HTTP_404_NOT_FOUND
-            )
-        
-        serializer = ProductSerializer(product, data=request.data, partial=True)
-        if serializer.is_valid():
+        with transaction.atomic():
+            # Locked until the facet counts are updated, so concurrent updates each replace the values they read
+            product = Product.objects.select_for_update().filter(id=product_id).first()
+            if not product:
+                logger.info(f"{request.user.username} tried to update non existing product with id: {product_id}")
+                return custom_response(
+                    message="Product not found",
+                    data={},
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+
+            previous = {field: getattr(product, field) for field in ('category', 'price', 'rating')}
+            serializer = ProductSerializer(product, data=request.data, partial=True)
+            if not serializer.is_valid():
+                logger.error(f"{request.user.username} failed to update product with id({product.id}).\nError:{serializer.errors}")
+                return custom_response(
+                    message="Validation Error",
+                    data=serializer.errors,
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
             serializer.save()
-            logger.info(f"{request.user.username} successfully updated a product with id({product.id}).\nData:{serializer.data}")
-            return custom_response(
-                message="Product updated successfully",
-                data=serializer.data,
-                status_code=status.HTTP_200_OK
-            )
-        logger.error(f"{request.user.username} failed to update product with id({product.id}).\nError:{serializer.errors}")
+            apply_facet_changes(removed=[previous], added=[product])
+        bump_catalog_version()
+        logger.info(f"{request.user.username} successfully updated a product with id({product.id}).\nData:{serializer.data}")
         return custom_response(
-            message="Validation Error",
-            data=serializer.errors,
-            status_code=status.HTTP_400_BAD_REQUEST
+            message="Product updated successfully",
+            data=serializer.data,
+            status_code=status.HTTP_200_OK
         )
     
     def delete_product(self, request, *args, **kwargs):
@@ -105,17 +181,20 @@ class ProductRetrieveUpdateDeleteView(BaseAPIView, generics.RetrieveUpdateDestro
         if not request.user.is_superuser:
             logger.error(f"{request.user.username} tried to delete a product with id({product_id})")
             raise exceptions.PermissionDenied
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            logger.info(f"{request.user.username} tried to delete non existing product with id: {product_id}")
-            return custom_response(
-                message="Product not found",
-                data={},
-                status_code=status.HTTP_404_NOT_FOUND
-            )
-        product.delete()
-        logger.info(f"{request.user.username} successfully deleted a product with id({product.id})")
+        with transaction.atomic():
+            product = Product.objects.select_for_update().filter(id=product_id).first()
+            deleted = product and product.delete()[1].get(Product._meta.label, 0)
+            if not deleted:
+                # Missing, or removed by a concurrent delete: its facet counts are not ours to change
+                logger.info(f"{request.user.username} tried to delete non existing product with id: {product_id}")
+                return custom_response(
+                    message="Product not found",
+                    data={},
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+            apply_facet_changes(removed=[product])
+        bump_catalog_version()
+        logger.info(f"{request.user.username} successfully deleted a product with id({product_id})")
         return custom_response(
             message="Product deleted successfully",
             data={},
@@ -133,3 +212,166 @@ class ProductRetrieveUpdateDeleteView(BaseAPIView, generics.RetrieveUpdateDestro
     
     def delete(self, request, *args, **kwargs):
         return self.handle_request(request, self.delete_product, *args, **kwargs)
+
+
+class ProductSearchView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+    paginator = CursorPaginator(ordering=('score', 'id'))
+
+    def get_search_cursor(self, request):
+        cursor = request.query_params.get('cursor')
+        if not cursor:
+            return None
+        score, product_id = decode_cursor(cursor, 2)
+        try:
+            return float(score), int(product_id)
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({"cursor": "Invalid cursor."})
+
+    def search_products(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise exceptions.ValidationError({"q": "Search query is required."})
+
+        fields = get_requested_fields(request.query_params)
+        limit = self.paginator.get_limit(request)
+        rows = search_product_ids(connection, query, limit + 1, after=self.get_search_cursor(request))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(list(rows[-1]))
+
+        products = Product.objects.filter(id__in=[product_id for _, product_id in rows]).values(*fields)
+        products = {product['id']: product for product in products}
+        ranked_products = [products[product_id] for _, product_id in rows if product_id in products]
+        logger.info(f"{request.user.username} searched products for '{query}'")
+        return custom_response(
+            message="Products fetched successfully",
+            data={
+                "results": ProductReadSerializer(fields).serialize_many(ranked_products),
+                "next_cursor": next_cursor,
+            },
+            status_code=status.HTTP_200_OK
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.search_products, *args, **kwargs)
+
+
+class ProductImportView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def import_products(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            logger.error(f"{request.user.username} tried to import products")
+            raise exceptions.PermissionDenied
+
+        content_type = request.content_type.split(';')[0].strip()
+        file_format = IMPORT_CONTENT_TYPES.get(content_type)
+        if not file_format:
+            raise exceptions.ValidationError({"content_type": f"Must be one of: {', '.join(IMPORT_CONTENT_TYPES)}."})
+        if request.stream is None:
+            raise exceptions.ValidationError({"body": "Request body is empty."})
+
+        # Read the body line by line instead of through request.data so it is never held in memory
+        lines = codecs.iterdecode(request.stream, 'utf-8-sig')
+        report = import_products(lines, file_format)
+        logger.info(f"{request.user.username} imported products. Imported: {report['imported']}, Failed: {report['failed']}")
+        return custom_response(
+            message="Products imported",
+            data=report,
+            status_code=status.HTTP_200_OK
+        )
+
+    def post(self, request, *args, **kwargs):
+        return self.handle_request(request, self.import_products, *args, **kwargs)
+
+
+class ProductExportView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def export_products(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            logger.error(f"{request.user.username} tried to export products")
+            raise exceptions.PermissionDenied
+
+        # `format` is reserved by DRF for content negotiation
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in EXPORT_FORMATS:
+            raise exceptions.ValidationError({"file_format": f"Must be one of: {', '.join(EXPORT_FORMATS)}."})
+
+        logger.info(f"{request.user.username} started a product export ({file_format})")
+        response = StreamingHttpResponse(export_products(file_format), content_type=EXPORT_FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.export_products, *args, **kwargs)
+
+
+class ProductFacetView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_facets(self, request, *args, **kwargs):
+        cache_key = catalog_cache_key('facets')
+        data = get_cached(cache_key)
+        if data is None:
+            data = get_facets()
+            set_cached(cache_key, data)
+        return custom_response(
+            message="Product facets fetched successfully",
+            data=data,
+            status_code=status.HTTP_200_OK
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.get_facets, *args, **kwargs)
+
+
+class ProductBatchView(BaseAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_requested_ids(self, request):
+        ids = request.query_params.get('ids', '')
+        try:
+            ids = [int(product_id) for product_id in ids.split(',') if product_id.strip()]
+        except ValueError:
+            raise exceptions.ValidationError({"ids": "Must be a comma separated list of product ids."})
+        if not ids:
+            raise exceptions.ValidationError({"ids": "At least one product id is required."})
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.PRODUCT_BATCH_MAX_IDS:
+            raise exceptions.ValidationError({"ids": f"At most {settings.PRODUCT_BATCH_MAX_IDS} ids can be requested at once."})
+        return ids
+
+    def get_products(self, request, *args, **kwargs):
+        ids = self.get_requested_ids(request)
+        fields = get_requested_fields(request.query_params)
+
+        # Same cache entries as the detail view, so products warmed there are reused here (and vice versa)
+        version = get_catalog_version()
+        keys = {product_id: catalog_cache_key('detail', product_id, ','.join(fields), version=version) for product_id in ids}
+        cached = get_many_cached(list(keys.values()))
+        products = {product_id: cached[key] for product_id, key in keys.items() if key in cached}
+
+        misses = [product_id for product_id in ids if product_id not in products]
+        if misses:
+            serializer = ProductReadSerializer(fields)
+            fetched = {
+                row['id']: serializer.to_representation(row)
+                for row in Product.objects.filter(id__in=misses).values(*fields)
+            }
+            set_many_cached({keys[product_id]: data for product_id, data in fetched.items()})
+            products.update(fetched)
+
+        return custom_response(
+            message="Products fetched successfully",
+            data={
+                "results": [products[product_id] for product_id in ids if product_id in products],
+                "missing": [product_id for product_id in ids if product_id not in products],
+            },
+            status_code=status.HTTP_200_OK
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.handle_request(request, self.get_products, *args, **kwargs)